@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Pipelined build of the comparison tables.
+Usage: python build_pipeline.py [--html PATH] [--pdf PATH] [--pack PATH] [--jobs N]
+                                [--bbox ...] [--near ...] [--typology TEXT]
+
+A build is split into stages that run at the same time, connected by
+bounded queues:
+
+    scanner ──> dispatcher ──> worker processes ──> writer ──> sinks
+                                                      ▲
+                                    metadata loader ──┘
+
+- the scanner lists the cells of the table, row by row, and checks which
+  tiles exist;
+- the metadata loader reads the Excel sheet in the background;
+- the dispatcher hands every cell to a pool of worker processes, which
+  decode and encode what the sinks need through the shared tile store;
+- the writer takes the results back in table order and passes them to
+  every sink (the HTML page, the PDF, ...).
+
+When the writer falls behind, the queues fill up and the stages before it
+wait: at most queue_size cells are in flight, however large the table is.
+"""
+
+import argparse
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from building_metadata import add_filter_arguments, filter_from_arguments, load_excel_data
+from tile_pack import open_tile_source
+from tile_store import DEFAULT_CACHE_DIR, MEMORY_LIMIT_MB, TileStore, set_memory_limit
+
+# Cells in flight between two stages
+QUEUE_SIZE = 64
+
+# End of a stage's output
+_DONE = object()
+
+# Tile store of a worker process, opened by the pool initializer
+_worker_store = None
+
+
+class TableSink:
+    """
+    Output of the pipeline. The writer calls, in table order:
+
+        begin(folders, image_names, shown_folders, shown_image_names, metadata)
+        start_row(row_index, image_name)
+        cell(row_index, column_index, folder_name, image_name, tile)   for each shown column
+        end_row(row_index, image_name)
+        ...
+        end()
+
+    Row and column indices are those of the whole tree. tile is None when
+    the tile is missing, the exception when it could not be loaded, or a
+    dict holding what kinds() asked for.
+    """
+
+    def kinds(self, folder_name):
+        """
+        What the workers prepare for the tiles of a folder: derivative kinds
+        of the tile store, 'source' for the encoded tile or 'size' for its
+        dimensions.
+        """
+        return []
+
+    def begin(self, folders, image_names, shown_folders, shown_image_names, metadata):
+        pass
+
+    def start_row(self, row_index, image_name):
+        pass
+
+    def cell(self, row_index, column_index, folder_name, image_name, tile):
+        pass
+
+    def end_row(self, row_index, image_name):
+        pass
+
+    def end(self):
+        pass
+
+
+def load_tile(store, folder_name, image_name, kinds):
+    """
+    Prepare the kinds a sink asked for of one tile.
+    """
+    tile = {}
+    derivatives = []
+    for kind in kinds:
+        if kind == 'source':
+            tile[kind] = bytes(store.tiles.read(folder_name, image_name))
+        elif kind == 'size':
+            tile[kind] = store.tiles.size(folder_name, image_name)
+        else:
+            derivatives.append(kind)
+    if derivatives:
+        # One decode for the derivatives of every sink
+        tile.update(store.get_many(folder_name, image_name, derivatives))
+    return tile
+
+
+def _init_worker(tiles, cache_dir, memory_limit_mb):
+    global _worker_store
+    set_memory_limit(memory_limit_mb)
+    _worker_store = TileStore(tiles, cache_dir)
+
+
+def _load_tile_in_worker(folder_name, image_name, kinds):
+    return load_tile(_worker_store, folder_name, image_name, kinds)
+
+
+def open_worker_pool(tiles, jobs=None, cache_dir=DEFAULT_CACHE_DIR, memory_limit_mb=MEMORY_LIMIT_MB):
+    """
+    Worker processes decoding the tiles of a tile folder or pack, each with
+    its own tile store. memory_limit_mb caps a single decode in each worker.
+    Can be shared by several run_pipeline() calls over the same tiles.
+    """
+    return ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                               initargs=(tiles, cache_dir, memory_limit_mb))
+
+
+def load_metadata_async(loader=load_excel_data):
+    """
+    Start loading the building metadata in the background. Returns a Future.
+    """
+    future = Future()
+
+    def load():
+        try:
+            future.set_result(loader())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=load, daemon=True).start()
+    return future
+
+
+def _put(stage_queue, item, stop):
+    """
+    Put an item in a bounded queue, giving up when the pipeline stops.
+    """
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(stage_queue, stop):
+    """
+    Take an item from a queue, None when the pipeline stops.
+    """
+    while not stop.is_set():
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def run_pipeline(tiles, sinks, rows=None, columns=None, row_filter=None, metadata=None, jobs=None, pool=None,
+                 cache_dir=DEFAULT_CACHE_DIR, memory_limit_mb=MEMORY_LIMIT_MB, queue_size=QUEUE_SIZE):
+    """
+    Build the table of a tile folder or pack into every sink.
+    Returns (folders, image_names) of the whole tree, then the shown folders
+    and image names.
+
+    rows and columns restrict the table to some image names and folders.
+    row_filter(image_names, metadata) narrows the rows down further from the
+    building metadata (see building_metadata.building_filter); the scanner
+    waits for the metadata then, so only the selected tiles are decoded.
+    metadata is the building metadata, a Future of it, or None to load the
+    Excel sheet while the tiles are scanned and decoded. Cells are decoded
+    by pool, or by a pool of jobs workers started when the first tile needs
+    one (jobs=0 decodes in a thread of this process instead).
+    """
+    if metadata is None:
+        metadata = load_metadata_async()
+    elif not isinstance(metadata, Future):
+        loaded, metadata = metadata, Future()
+        metadata.set_result(loaded)
+
+    stop = threading.Event()
+    scanned = queue.Queue(maxsize=queue_size)
+    dispatched = queue.Queue(maxsize=queue_size)
+    owned_pool = []
+
+    def scan():
+        source = None
+        try:
+            source = open_tile_source(tiles)
+            folders, image_names = source.folders(), source.image_names()
+            shown_rows = set(image_names if rows is None else rows)
+            if row_filter is not None:
+                shown_rows &= set(row_filter(image_names, metadata.result()))
+            shown_columns = set(folders if columns is None else columns)
+            shown_folders = [f for f in folders if f in shown_columns]
+            shown_image_names = [i for i in image_names if i in shown_rows]
+            if not _put(scanned, ('axes', folders, image_names, shown_folders, shown_image_names), stop):
+                return
+            for row_index, image_name in enumerate(image_names):
+                if image_name not in shown_rows:
+                    continue
+                if not _put(scanned, ('row', row_index, image_name), stop):
+                    return
+                for column_index, folder_name in enumerate(folders):
+                    if folder_name not in shown_columns:
+                        continue
+                    exists = source.exists(folder_name, image_name)
+                    if not _put(scanned, ('cell', row_index, column_index, folder_name, image_name, exists), stop):
+                        return
+            _put(scanned, _DONE, stop)
+        except BaseException as e:
+            _put(scanned, e, stop)
+        finally:
+            if source is not None and source is not tiles:
+                source.close()
+
+    def dispatch():
+        kinds_by_folder = {}
+        store = None
+        try:
+            while True:
+                item = _get(scanned, stop)
+                if item is None:
+                    return
+                if item is _DONE or isinstance(item, BaseException) or item[0] != 'cell':
+                    _put(dispatched, item, stop)
+                    if item is _DONE or isinstance(item, BaseException):
+                        return
+                    continue
+
+                _, row_index, column_index, folder_name, image_name, exists = item
+                if folder_name not in kinds_by_folder:
+                    kinds_by_folder[folder_name] = list(dict.fromkeys(
+                        kind for sink in sinks for kind in sink.kinds(folder_name)))
+                kinds = kinds_by_folder[folder_name]
+
+                if not exists:
+                    future = None
+                elif not kinds:
+                    future = Future()
+                    future.set_result({})
+                elif jobs == 0 and pool is None:
+                    # Decode here, the writer still overlaps with it
+                    if store is None:
+                        store = TileStore(tiles, cache_dir, memory_limit_mb)
+                    future = Future()
+                    try:
+                        future.set_result(load_tile(store, folder_name, image_name, kinds))
+                    except Exception as e:
+                        future.set_exception(e)
+                else:
+                    worker_pool = pool
+                    if worker_pool is None:
+                        if not owned_pool:
+                            owned_pool.append(open_worker_pool(tiles, jobs, cache_dir, memory_limit_mb))
+                        worker_pool = owned_pool[0]
+                    future = worker_pool.submit(_load_tile_in_worker, folder_name, image_name, kinds)
+
+                if not _put(dispatched, ('cell', row_index, column_index, folder_name, image_name, future), stop):
+                    return
+        except BaseException as e:
+            _put(dispatched, e, stop)
+        finally:
+            if store is not None:
+                store.close()
+
+    stages = [threading.Thread(target=scan, daemon=True), threading.Thread(target=dispatch, daemon=True)]
+    for stage in stages:
+        stage.start()
+
+    # Writer: results come back in table order, whichever worker finishes first
+    try:
+        current_row = None
+        while True:
+            item = dispatched.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+
+            if item[0] == 'axes':
+                _, folders, image_names, shown_folders, shown_image_names = item
+                building_metadata = metadata.result()
+                for sink in sinks:
+                    sink.begin(folders, image_names, shown_folders, shown_image_names, building_metadata)
+            elif item[0] == 'row':
+                if current_row is not None:
+                    for sink in sinks:
+                        sink.end_row(*current_row)
+                current_row = item[1:]
+                for sink in sinks:
+                    sink.start_row(*current_row)
+            else:
+                _, row_index, column_index, folder_name, image_name, future = item
+                tile = None
+                if future is not None:
+                    try:
+                        tile = future.result()
+                    except Exception as e:
+                        tile = e
+                for sink in sinks:
+                    sink.cell(row_index, column_index, folder_name, image_name, tile)
+
+        if current_row is not None:
+            for sink in sinks:
+                sink.end_row(*current_row)
+        for sink in sinks:
+            sink.end()
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join()
+        for worker_pool in owned_pool:
+            worker_pool.shutdown(cancel_futures=True)
+
+    return folders, image_names, shown_folders, shown_image_names
+
+
+def main():
+    # The builders import this module, their sinks are imported here
+    from make_eval_table import ComparisonPdfSink
+    from make_interactive_table import InteractiveTableSink
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(script_dir)
+
+    parser = argparse.ArgumentParser(description="Build the HTML and PDF comparison tables in one pass")
+    parser.add_argument('--html', default=os.path.join(project_root, "interactive_image_table.html"),
+                        help="interactive table to write")
+    parser.add_argument('--pdf', default=os.path.join(script_dir, "image_comparison_table.pdf"),
+                        help="PDF table to write")
+    parser.add_argument('--no-html', action='store_true', help="do not write the interactive table")
+    parser.add_argument('--no-pdf', action='store_true', help="do not write the PDF table")
+    parser.add_argument('--pack', help="read the tiles from a pack built by tile_pack.py instead of the folders")
+    parser.add_argument('--jobs', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--memory-limit', type=int, default=MEMORY_LIMIT_MB,
+                        help="memory in MB a single image decode may use in each worker")
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    base_folder = args.pack or script_dir
+    if not args.pack and not os.path.exists(os.path.join(base_folder, "google_earth_images")):
+        print("Error: Cannot find 'google_earth_images' folder")
+        print("Base folder:", base_folder)
+        exit(1)
+
+    sinks = []
+    html_file = None
+    try:
+        if not args.no_html:
+            # The page is streamed to disk row by row
+            html_file = open(args.html, 'w', encoding='utf-8')
+            selections_url = os.path.relpath(os.path.join(project_root, "selections.json"),
+                                             os.path.dirname(os.path.abspath(args.html))).replace(os.sep, '/')
+            sinks.append(InteractiveTableSink(html_file, selections_url))
+        if not args.no_pdf:
+            sinks.append(ComparisonPdfSink(args.pdf))
+        folders, image_names, _, shown_image_names = run_pipeline(
+            base_folder, sinks, row_filter=filter_from_arguments(args), jobs=args.jobs,
+            memory_limit_mb=args.memory_limit)
+    finally:
+        if html_file is not None:
+            html_file.close()
+
+    if html_file is not None:
+        print(f"Interactive HTML table created: {args.html}")
+    print(f"Found {len(folders)} folders and {len(image_names)} images, showing {len(shown_image_names)} images")
+
+
+if __name__ == "__main__":
+    main()
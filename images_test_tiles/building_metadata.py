@@ -0,0 +1,200 @@
+"""
+Metadata of the test buildings, read from the Excel sheet of test addresses.
+Shared by the HTML and PDF builders.
+
+BuildingIndex puts the buildings on a grid by coordinates, so the builders
+can restrict a table to an area or a typology before any image is decoded.
+"""
+
+import argparse
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+from tile_pack import IMAGE_EXTENSIONS
+
+EXCEL_PATH = r"C:\Users\Leandre\Github\LOD2\Adresses_de_test.xlsx"
+
+# Mean Earth radius, for distances between coordinates
+EARTH_RADIUS_M = 6371008.8
+
+# Side of a grid cell of BuildingIndex, about 1 km
+GRID_CELL_DEGREES = 0.01
+
+def load_excel_data(excel_path=EXCEL_PATH):
+    """
+    Load the test building metadata, keyed by image name without extension.
+    """
+    df = pd.read_excel(excel_path)
+    excel_data = {}
+    for _, row in df.iterrows():
+        image_name = str(row['ID'])
+        if pd.notna(row['ID']):  # Skip rows with no ID
+            excel_data[image_name] = {
+                'address': str(row['Adresse']) if pd.notna(row['Adresse']) else '',
+                'coordinates': str(row['Lat, Lon (mercato)']) if pd.notna(row['Lat, Lon (mercato)']) else '',
+                'typology': str(row['Typologie urbaine, complexité toit, hauteur']) if pd.notna(row['Typologie urbaine, complexité toit, hauteur']) else '',
+                'description': str(row['Description du cas particulier']) if pd.notna(row['Description du cas particulier']) else '',
+                'manual_change': row['Recours à un changement manuel des nuages de points']
+            }
+    return excel_data
+
+def parse_coordinates(text):
+    """
+    '48.8566, 2.3522' -> (48.8566, 2.3522), None when the cell holds no coordinates.
+    """
+    numbers = re.findall(r'[-+]?\d+(?:\.\d+)?', text or '')
+    if len(numbers) < 2:
+        return None
+    lat, lon = float(numbers[0]), float(numbers[1])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+def image_stem(image_name):
+    """
+    3_B_bis.png -> 3_B_bis, the ID of the building in the Excel sheet.
+    """
+    for extension in IMAGE_EXTENSIONS:
+        if image_name.lower().endswith(extension):
+            return image_name[:-len(extension)]
+    return image_name
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in meters, element-wise over NumPy arrays.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+class BuildingIndex:
+    """
+    Uniform grid over the test buildings, for bounding box, radius and
+    typology queries. Coordinates are parsed from the 'Lat, Lon (mercato)'
+    column into NumPy arrays; buildings without coordinates only match
+    typology queries.
+    """
+    
+    def __init__(self, excel_data, cell_degrees=GRID_CELL_DEGREES):
+        self.names = list(excel_data)
+        self.typologies = [excel_data[name]['typology'].lower() for name in self.names]
+        coordinates = [parse_coordinates(excel_data[name]['coordinates']) for name in self.names]
+        self.lat = np.array([c[0] if c else np.nan for c in coordinates], dtype=float)
+        self.lon = np.array([c[1] if c else np.nan for c in coordinates], dtype=float)
+        
+        # Grid cell -> indices of the buildings inside it
+        self.cell_degrees = cell_degrees
+        cells = {}
+        for i in np.flatnonzero(~np.isnan(self.lat)):
+            cells.setdefault(self.cell(self.lat[i], self.lon[i]), []).append(i)
+        self.cells = {key: np.array(indices) for key, indices in cells.items()}
+    
+    def cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+    
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Indices of the buildings in the grid cells overlapping a bounding box.
+        """
+        (row0, col0), (row1, col1) = self.cell(min_lat, min_lon), self.cell(max_lat, max_lon)
+        if (row1 - row0 + 1) * (col1 - col0 + 1) > len(self.cells):
+            # Large box: walking the occupied cells is cheaper
+            keys = [key for key in self.cells if row0 <= key[0] <= row1 and col0 <= key[1] <= col1]
+        else:
+            keys = [(row, col) for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)
+                    if (row, col) in self.cells]
+        if not keys:
+            return np.array([], dtype=int)
+        return np.concatenate([self.cells[key] for key in keys])
+    
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Names of the buildings inside a bounding box, in degrees.
+        """
+        indices = self.candidates(min_lat, min_lon, max_lat, max_lon)
+        lat, lon = self.lat[indices], self.lon[indices]
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return {self.names[i] for i in indices[inside]}
+    
+    def within(self, lat, lon, radius_m):
+        """
+        Names of the buildings within radius_m meters of a point, nearest first.
+        """
+        # Bounding box of the circle, then exact distances on its buildings only
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        dlon = min(180.0, dlat / max(math.cos(math.radians(lat)), 1e-6))
+        indices = self.candidates(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        distances = haversine_m(lat, lon, self.lat[indices], self.lon[indices])
+        order = np.argsort(distances, kind='stable')
+        return [self.names[indices[i]] for i in order if distances[i] <= radius_m]
+    
+    def with_typology(self, text):
+        """
+        Names of the buildings whose typology contains text, ignoring case.
+        """
+        text = text.lower()
+        return {name for name, typology in zip(self.names, self.typologies) if text in typology}
+    
+    def select(self, bbox=None, near=None, typology=None):
+        """
+        Names of the buildings matching every query given:
+        bbox (min_lat, min_lon, max_lat, max_lon), near (lat, lon, radius_m)
+        and a typology substring.
+        """
+        selected = set(self.names)
+        if bbox is not None:
+            selected &= self.in_bbox(*bbox)
+        if near is not None:
+            selected &= set(self.within(*near))
+        if typology is not None:
+            selected &= self.with_typology(typology)
+        return selected
+
+def building_filter(bbox=None, near=None, typology=None):
+    """
+    Row filter for run_pipeline(): keeps the image rows of the buildings
+    matching every query given (see BuildingIndex.select). None without queries.
+    """
+    if bbox is None and near is None and typology is None:
+        return None
+    
+    def select_rows(image_names, excel_data):
+        selected = BuildingIndex(excel_data).select(bbox, near, typology)
+        rows = [image_name for image_name in image_names if image_stem(image_name) in selected]
+        print(f"Selected {len(rows)} of {len(image_names)} images")
+        return rows
+    
+    return select_rows
+
+def float_tuple(count):
+    """
+    argparse type for count comma-separated numbers.
+    """
+    def parse(text):
+        try:
+            values = tuple(float(value) for value in text.split(','))
+        except ValueError:
+            values = ()
+        if len(values) != count:
+            raise argparse.ArgumentTypeError(f"expected {count} comma-separated numbers, got '{text}'")
+        return values
+    return parse
+
+def add_filter_arguments(parser):
+    """
+    Command line options selecting buildings from the Excel sheet.
+    """
+    parser.add_argument('--bbox', type=float_tuple(4), metavar='MIN_LAT,MIN_LON,MAX_LAT,MAX_LON',
+                        help="only the buildings inside this bounding box")
+    parser.add_argument('--near', type=float_tuple(3), metavar='LAT,LON,RADIUS_M',
+                        help="only the buildings within RADIUS_M meters of this point")
+    parser.add_argument('--typology', help="only the buildings whose typology contains this text")
+
+def filter_from_arguments(args):
+    """
+    Row filter built from the options of add_filter_arguments().
+    """
+    return building_filter(args.bbox, args.near, args.typology)
@@ -1,149 +1,257 @@
 import os
-import pandas as pd
 from PIL import Image
 import base64
-from io import BytesIO
+from io import BytesIO, StringIO
 import json
+import argparse
+from build_pipeline import TableSink, load_metadata_async, open_worker_pool, run_pipeline
+from building_metadata import add_filter_arguments, filter_from_arguments
+from tile_pack import open_tile_source
+from tile_store import MEMORY_LIMIT_MB, TileStore, set_memory_limit
 
-def load_selections(selections_file):
-    """
-    Load selected image IDs from a JSON file.
-    """
-    try:
-        if os.path.exists(selections_file):
-            with open(selections_file, 'r') as f:
-                data = json.load(f)
-                return set(data.get('selected_images', []))
-        else:
-            return set()
-    except Exception as e:
-        print(f"Warning: Could not load selections from {selections_file}: {e}")
-        return set()
-
-def create_interactive_image_table(base_folder, output_html, selected_images=None):
+def create_interactive_image_table(base_folder, output_html, selections_url="selections.json", jobs=None,
+                                   memory_limit_mb=MEMORY_LIMIT_MB, row_filter=None):
     """
     Create an interactive HTML table with hover tooltips showing bigger images.
     Same layout as the PDF version but with interactive hover effects.
+    base_folder is the images_test_tiles folder or a tile pack built by tile_pack.py.
+    row_filter keeps some buildings only (see building_metadata.building_filter).
     """
-    if selected_images is None:
-        selected_images = set()
-    
-    # Load Excel data
-    excel_path = r"C:\Users\Leandre\Github\LOD2\Adresses_de_test.xlsx"
-    df = pd.read_excel(excel_path)
-    excel_data = {}
-    for _, row in df.iterrows():
-        image_name = str(row['ID'])
-        if pd.notna(row['ID']):
-            excel_data[image_name] = {
-                'address': str(row['Adresse']) if pd.notna(row['Adresse']) else '',
-                'coordinates': str(row['Lat, Lon (mercato)']) if pd.notna(row['Lat, Lon (mercato)']) else '',
-                'typology': str(row['Typologie urbaine, complexité toit, hauteur']) if pd.notna(row['Typologie urbaine, complexité toit, hauteur']) else '',
-                'description': str(row['Description du cas particulier']) if pd.notna(row['Description du cas particulier']) else '',
-                'manual_change': row['Recours à un changement manuel des nuages de points']
-            }
+    # The HTML file is written row by row while the next tiles are decoded
+    with open(output_html, 'w', encoding='utf-8') as f:
+        sink = InteractiveTableSink(f, selections_url)
+        folders, image_names, _, shown_image_names = run_pipeline(base_folder, [sink], row_filter=row_filter,
+                                                                  jobs=jobs, memory_limit_mb=memory_limit_mb)
     
-    # Get all folders (excluding the script file)
-    folders = [f for f in os.listdir(base_folder) 
-               if os.path.isdir(os.path.join(base_folder, f)) and f != '__pycache__']
+    print(f"Interactive HTML table created: {output_html}")
+    print(f"Found {len(folders)} folders and {len(image_names)} images, showing {len(shown_image_names)} images")
+
+SHARD_LABELS = {
+    'group': "Building group",
+    'family': "Parameter family",
+    'both': "Building group and parameter family",
+}
+
+def shard_key(name, shard_by):
+    """
+    Shard of a row or column: '3_B_bis.png' -> '3' for building groups,
+    'cd20cf07pdk5pmp60eps02' -> 'cd20cf07pdk5' for parameter families.
+    """
+    if shard_by == 'group':
+        return name.split('_')[0]
+    pmp_pos = name.find('pmp')
+    return name[:pmp_pos] if pmp_pos > 0 else name
+
+def plan_shards(folders, image_names, shard_by='group'):
+    """
+    Split the table into shards. Returns {key: (rows, columns)}.
+    Building groups keep every column, parameter families keep every row
+    and the Google Earth column, 'both' crosses the two: the rows of a group
+    by the columns of a family.
+    """
+    shards = {}
+    if shard_by == 'group':
+        for image_name in image_names:
+            shards.setdefault(shard_key(image_name, shard_by), ([], folders))[0].append(image_name)
+    elif shard_by == 'family':
+        for folder_name in folders:
+            if folder_name == 'google_earth_images':
+                continue
+            columns = shards.setdefault(shard_key(folder_name, shard_by), (image_names, []))[1]
+            if not columns and 'google_earth_images' in folders:
+                columns.append('google_earth_images')
+            columns.append(folder_name)
+    else:
+        families = plan_shards(folders, image_names, 'family')
+        for group, (rows, _) in plan_shards(folders, image_names, 'group').items():
+            for family, (_, columns) in families.items():
+                shards[f"{group}_{family}"] = (rows, columns)
+    return shards
+
+def create_sharded_image_tables(base_folder, output_dir, shard_by='group', selections_file=None, jobs=None,
+                                memory_limit_mb=MEMORY_LIMIT_MB, row_filter=None):
+    """
+    Write one table per building group (2_*, 3_*, ...), per parameter family
+    or per group and family ('both') into output_dir, plus an index.html
+    linking to them. The shards share one pool of worker processes, so the
+    tiles of a shard decode in parallel. Each page only embeds the images of
+    its shard, but a group page still grows with the number of configurations
+    and a family page with the number of buildings; only 'both' bounds the
+    two. row_filter keeps some buildings only.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if selections_file is None:
+        selections_file = os.path.join(os.path.dirname(os.path.abspath(base_folder)), "selections.json")
+    selections_url = os.path.relpath(selections_file, output_dir).replace(os.sep, '/')
     
-    # Sort folders to put google_earth_images first
-    if 'google_earth_images' in folders:
-        folders.remove('google_earth_images')
-        folders.insert(0, 'google_earth_images')
+    excel_data = load_metadata_async()  # read while the first shard decodes
+    with open_tile_source(base_folder) as tiles:
+        folders, image_names = tiles.folders(), tiles.image_names()
+    shown_image_names = image_names
+    if row_filter is not None:
+        # Shards are planned over the selected buildings only
+        shown_image_names = row_filter(image_names, excel_data.result())
+    shards = plan_shards(folders, shown_image_names, shard_by)
     
-    # Get all image names from the first folder
-    first_folder = folders[0]
-    image_names = [f for f in os.listdir(os.path.join(base_folder, first_folder)) 
-                  if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    image_names.sort()
+    label = SHARD_LABELS[shard_by]
+    # memory_limit_mb caps a single decode in each worker
+    with open_worker_pool(base_folder, jobs, memory_limit_mb=memory_limit_mb) as pool:
+        for key, (rows, columns) in shards.items():
+            output_html = os.path.join(output_dir, f"{shard_by}_{key}.html")
+            title = f"Interactive Image Comparison Table - {label} {key}"
+            with open(output_html, 'w', encoding='utf-8') as f:
+                sink = InteractiveTableSink(f, selections_url, title=title)
+                run_pipeline(base_folder, [sink], rows, columns, metadata=excel_data, pool=pool)
+            print(f"Shard created: {output_html}")
     
-    # Parse folder names for detailed descriptions
-    def parse_folder_name(folder_name):
-        if folder_name == 'google_earth_images':
-            return 'Google Earth'
-        elif folder_name.startswith('cd'):
-            try:
-                cd_pos = folder_name.find('cd') + 2
-                cf_pos = folder_name.find('cf')
-                pdk_pos = folder_name.find('pdk')
-                pmp_pos = folder_name.find('pmp')
-                eps_pos = folder_name.find('eps')
-                
-                ceil_density = folder_name[cd_pos:cf_pos]
-                complexity_factor = folder_name[cf_pos+2:pdk_pos]
-                plane_detect_k = folder_name[pdk_pos+3:pmp_pos]
-                plane_min_points = folder_name[pmp_pos+3:eps_pos]
-                epsilon = folder_name[eps_pos+3:]
-                
-                cf_float = float(complexity_factor) / 10
-                eps_float = float(epsilon) / 10
-                
-                return f"Ceil Density: {ceil_density}<br>Complexity Factor: {cf_float}<br>Plane Detect K: {plane_detect_k}<br>Plane Min Points: {plane_min_points}<br>Epsilon: {eps_float}"
-            except (ValueError, IndexError):
-                return folder_name
-        else:
-            return folder_name
+    index_html = os.path.join(output_dir, "index.html")
+    with open(index_html, 'w', encoding='utf-8') as f:
+        f.write(build_shard_index_html(base_folder, shards, shard_by, label))
     
-    # Convert images to base64 (both small and large versions)
-    def image_to_base64(image_path, max_size=(800, 800)):
+    print(f"Index created: {index_html}")
+    print(f"Found {len(folders)} folders and {len(image_names)} images, "
+          f"showing {len(shown_image_names)} images in {len(shards)} shards")
+
+def build_shard_index_html(base_folder, shards, shard_by, label):
+    """
+    Small page linking to every shard with a thumbnail of its first image.
+    """
+    cards = ''
+    for key, (rows, columns) in shards.items():
+        # Google Earth view of the group, or the first reconstruction of the family
+        preview_folder = columns[0] if shard_by == 'group' or len(columns) < 2 else columns[1]
+        preview = ''
         try:
-            img = Image.open(image_path)
-            
-            # Special handling for Google Earth images - make them square
-            if 'google_earth_images' in image_path:
-                img_width, img_height = img.size
-                min_dim = min(img_width, img_height)
-                left = (img_width - min_dim) // 2
-                top = (img_height - min_dim) // 2
-                right = left + min_dim
-                bottom = top + min_dim
-                img = img.crop((left, top, right, bottom))
-            
-            # Resize for display
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Convert to base64
+            # JPEG keeps the index page small
+            with TileStore(base_folder) as store:
+                img = Image.open(BytesIO(store.get(preview_folder, rows[0], 'thumbnail')))
+            img.thumbnail((200, 200), Image.Resampling.LANCZOS)
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.convert('RGBA'))
             buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            return f"data:image/png;base64,{img_str}"
+            background.save(buffer, format='JPEG', quality=80)
+            preview = f'<img src="data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode()}" alt="{key}">'
         except Exception as e:
-            return None
+            print(f"Error creating the preview of {label} {key}: {e}")
+        cards += f'''            <a class="shard" href="{shard_by}_{key}.html">
+                {preview}
+                <div><strong>{label} {key}</strong></div>
+                <div>{len(rows)} images, {len(columns)} columns</div>
+            </a>
+'''
     
-    def image_to_base64_tooltip(image_path, max_size=(1200, 1200)):
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Interactive Image Comparison Tables</title>
+    <style>
+        body {{
+            font-family: Arial, sans-serif;
+            margin: 0;
+            padding: 20px;
+            background-color: #f5f5f5;
+        }}
+        
+        .shards {{
+            display: flex;
+            flex-wrap: wrap;
+            gap: 16px;
+        }}
+        
+        .shard {{
+            background: white;
+            border-radius: 8px;
+            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+            padding: 10px;
+            width: 200px;
+            text-align: center;
+            color: #333;
+            text-decoration: none;
+            font-size: 14px;
+        }}
+        
+        .shard img {{
+            max-width: 200px;
+            max-height: 200px;
+            object-fit: contain;
+        }}
+    </style>
+</head>
+<body>
+    <h1>Interactive Image Comparison Tables</h1>
+    <div class="shards">
+{cards}    </div>
+</body>
+</html>
+"""
+
+def parse_folder_name(folder_name):
+    """
+    Header of a folder column: the parameters of the sweep, one per line.
+    """
+    if folder_name == 'google_earth_images':
+        return 'Google Earth'
+    elif folder_name.startswith('cd'):
         try:
-            img = Image.open(image_path)
-            
-            # Special handling for Google Earth images - make them square
-            if 'google_earth_images' in image_path:
-                img_width, img_height = img.size
-                min_dim = min(img_width, img_height)
-                left = (img_width - min_dim) // 2
-                top = (img_height - min_dim) // 2
-                right = left + min_dim
-                bottom = top + min_dim
-                img = img.crop((left, top, right, bottom))
-            
-            # Resize for tooltip (larger)
-            img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Convert to base64
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            return f"data:image/png;base64,{img_str}"
-        except Exception as e:
-            return None
+            cd_pos = folder_name.find('cd') + 2
+            cf_pos = folder_name.find('cf')
+            pdk_pos = folder_name.find('pdk')
+            pmp_pos = folder_name.find('pmp')
+            eps_pos = folder_name.find('eps')
+            
+            ceil_density = folder_name[cd_pos:cf_pos]
+            complexity_factor = folder_name[cf_pos+2:pdk_pos]
+            plane_detect_k = folder_name[pdk_pos+3:pmp_pos]
+            plane_min_points = folder_name[pmp_pos+3:eps_pos]
+            epsilon = folder_name[eps_pos+3:]
+            
+            cf_float = float(complexity_factor) / 10
+            eps_float = float(epsilon) / 10
+            
+            return f"Ceil Density: {ceil_density}<br>Complexity Factor: {cf_float}<br>Plane Detect K: {plane_detect_k}<br>Plane Min Points: {plane_min_points}<br>Epsilon: {eps_float}"
+        except (ValueError, IndexError):
+            return folder_name
+    else:
+        return folder_name
+
+class InteractiveTableSink(TableSink):
+    """
+    Pipeline sink writing the interactive table to a text file, row by row,
+    so the page is never held in memory.
+    Selections are not baked in: the page loads selections_url (relative to the
+    page) when it opens, or its .js sidecar when fetch() is not available.
+    image_src(folder_name, image_name) gives the src of each cell,
+    by default the image is embedded as a base64 thumbnail.
+    """
+    
+    def __init__(self, out, selections_url="selections.json", image_src=None,
+                 title="Interactive Image Comparison Table"):
+        self.out = out
+        self.selections_url = selections_url
+        self.selections_sidecar_url = os.path.splitext(selections_url)[0] + ".js"
+        self.image_src = image_src
+        self.title = title
     
-    # Generate HTML
-    html_content = f"""
+    def kinds(self, folder_name):
+        # Thumbnails are only decoded when they are embedded
+        return [] if self.image_src else ['thumbnail']
+    
+    def begin(self, folders, image_names, shown_folders, shown_image_names, metadata):
+        self.folders = folders
+        self.image_names = image_names
+        self.excel_data = metadata
+        title = self.title
+        
+        # Generate HTML
+        html_content = f"""
     <!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Interactive Image Comparison Table</title>
+        <title>{title}</title>
         <style>
             body {{
                 font-family: Arial, sans-serif;
@@ -164,7 +272,7 @@ def create_interactive_image_table(base_folder, output_html, selected_images=Non
             table {{
                 width: 100%;
                 border-collapse: collapse;
-                min-width: {len(folders) * 200 + 300}px;
+                min-width: {len(shown_folders) * 200 + 300}px;
             }}
             
             th, td {{
@@ -272,35 +380,38 @@ def create_interactive_image_table(base_folder, output_html, selected_images=Non
         </style>
     </head>
     <body>
-        <h1>Interactive Image Comparison Table</h1>
+        <h1>{title}</h1>
         <div class="table-container">
             <table>
                 <thead>
                     <tr>
                         <th class="image-name-header">Image Name</th>
     """
-    
-    # Add column numbers row
-    for col_number in range(1, len(folders) + 1):
-        html_content += f'                        <th class="column-number-header">{col_number}</th>\n'
-    
-    html_content += """                    </tr>
+        
+        # Add column numbers row
+        for col_number, folder_name in enumerate(folders, 1):
+            if folder_name not in shown_folders:
+                continue
+            html_content += f'                        <th class="column-number-header">{col_number}</th>\n'
+        
+        html_content += """                    </tr>
                     <tr>
                         <th class="image-name-header">Image Name</th>
     """
-    
-    # Add folder headers
-    for folder_name in folders:
-        display_name = parse_folder_name(folder_name)
-        html_content += f'                        <th class="folder-header">{display_name}</th>\n'
-    
-    html_content += """                    </tr>
+        
+        # Add folder headers
+        for folder_name in shown_folders:
+            display_name = parse_folder_name(folder_name)
+            html_content += f'                        <th class="folder-header">{display_name}</th>\n'
+        
+        html_content += """                    </tr>
                 </thead>
                 <tbody>
     """
+        self.out.write(html_content)
     
-    # Add rows
-    for image_name in image_names:
+    def start_row(self, row_index, image_name):
+        excel_data = self.excel_data
         image_name_text = image_name.replace('.png', '').replace('.jpg', '').replace('.jpeg', '')
         
         # Check if this row needs manual change background
@@ -310,7 +421,7 @@ def create_interactive_image_table(base_folder, output_html, selected_images=Non
             if manual_change_value == 1.0:
                 manual_change_class = "manual-change"
         
-        html_content += f'                    <tr class="{manual_change_class}">\n'
+        html_content = f'                    <tr class="{manual_change_class}">\n'
         
         # Image name column
         html_content += f'                        <td class="image-name-col">\n'
@@ -331,106 +442,328 @@ def create_interactive_image_table(base_folder, output_html, selected_images=Non
             html_content += '                            </div>\n'
         
         html_content += '                        </td>\n'
+        self.out.write(html_content)
+    
+    def cell(self, row_index, column_index, folder_name, image_name, tile):
+        html_content = '                        <td class="image-cell">\n'
         
-        # Image columns
-        for folder_name in folders:
-            folder_path = os.path.join(base_folder, folder_name)
-            image_path = os.path.join(folder_path, image_name)
-            
-            html_content += '                        <td class="image-cell">\n'
+        if tile is not None:
+            # Embedded base64 thumbnail, or the URL given by image_src
+            if self.image_src is not None:
+                img_small = self.image_src(folder_name, image_name)
+            elif isinstance(tile, Exception):
+                img_small = None
+            else:
+                img_small = f"data:image/png;base64,{base64.b64encode(tile['thumbnail']).decode()}"
             
-            if os.path.exists(image_path):
-                # Convert small image to base64
-                img_small = image_to_base64(image_path, (800, 800))
-                
-                if img_small:
-                    # Create unique ID for each image
-                    image_id = f"img_{folder_name}_{image_name.replace('.', '_')}"
-                    html_content += f'''                            <img id="{image_id}" 
+            if img_small:
+                # Each image is addressed by its (row, column) index
+                image_id = f"cell_{row_index}_{column_index}"
+                html_content += f'''                            <img id="{image_id}" 
                                  src="{img_small}" 
                                  style="max-width: 400px; max-height: 300px; object-fit: contain;"
                                  alt="{image_name}"
-                                 onclick="toggleSelection('{image_id}')">\n'''
-                else:
-                    html_content += f'                            <div>Error loading image</div>\n'
+                                 onclick="toggleSelection({row_index}, {column_index})">\n'''
             else:
-                html_content += '                            <div>Missing</div>\n'
-            
-            html_content += '                        </td>\n'
+                html_content += f'                            <div>Error loading image</div>\n'
+        else:
+            html_content += '                            <div>Missing</div>\n'
         
-        html_content += '                    </tr>\n'
+        html_content += '                        </td>\n'
+        self.out.write(html_content)
+    
+    def end_row(self, row_index, image_name):
+        self.out.write('                    </tr>\n')
     
-    html_content += """                </tbody>
+    def end(self):
+        html_content = """                </tbody>
             </table>
         </div>
         
         <script>
-            // Function to toggle image selection
-            function toggleSelection(imageId) {
-                const img = document.getElementById(imageId);
-                const isSelected = img.classList.contains('selected');
-                
-                if (isSelected) {
-                    // Remove selection
-                    img.classList.remove('selected');
-                    localStorage.removeItem(imageId);
+            // Table axes: cell (row, column) is bit row * columns + column of the selection bitset
+            const TABLE_ROWS = {table_rows_json};
+            const TABLE_COLUMNS = {table_columns_json};
+            const CELL_COUNT = TABLE_ROWS.length * TABLE_COLUMNS.length;
+            const STORAGE_KEY = 'imageTableSelections';
+            let selectionBits = new Uint8Array(Math.ceil(CELL_COUNT / 8));
+            
+            function getBit(bits, index) {
+                return (bits[index >> 3] >> (index & 7)) & 1;
+            }
+            
+            function setBit(bits, index, value) {
+                if (value) {
+                    bits[index >> 3] |= 1 << (index & 7);
                 } else {
-                    // Add selection
-                    img.classList.add('selected');
-                    localStorage.setItem(imageId, 'selected');
+                    bits[index >> 3] &= ~(1 << (index & 7));
+                }
+            }
+            
+            function encodeBits(bits) {
+                let text = '';
+                for (let i = 0; i < bits.length; i++) {
+                    text += String.fromCharCode(bits[i]);
+                }
+                return btoa(text);
+            }
+            
+            function decodeBits(text) {
+                const raw = atob(text || '');
+                const bits = new Uint8Array(raw.length);
+                for (let i = 0; i < raw.length; i++) {
+                    bits[i] = raw.charCodeAt(i);
+                }
+                return bits;
+            }
+            
+            function sameAxis(a, b) {
+                return a.length === b.length && a.every((name, i) => name === b[i]);
+            }
+            
+            // Legacy per-image ID, used to read selections saved before the bitset format
+            function legacyId(row, column) {
+                return `img_${column}_${row.replace(/\\./g, '_')}`;
+            }
+            
+            // Convert a {rows, columns, bits} record to the bits of the given
+            // axes, remapping by name when it was written for other axes
+            function toBits(record, tableRows, tableColumns) {
+                const bits = new Uint8Array(Math.ceil(tableRows.length * tableColumns.length / 8));
+                if (!record) {
+                    return bits;
+                }
+                if (record.selected_images) {
+                    const wanted = new Set(record.selected_images);
+                    tableRows.forEach((row, r) => tableColumns.forEach((column, c) => {
+                        if (wanted.has(legacyId(row, column))) {
+                            setBit(bits, r * tableColumns.length + c, 1);
+                        }
+                    }));
+                    return bits;
+                }
+                const saved = decodeBits(record.bits);
+                const rows = record.rows || TABLE_ROWS;
+                const columns = record.columns || TABLE_COLUMNS;
+                if (sameAxis(rows, tableRows) && sameAxis(columns, tableColumns)) {
+                    bits.set(saved.subarray(0, bits.length));
+                    return bits;
+                }
+                const rowIndex = new Map(tableRows.map((name, i) => [name, i]));
+                const columnIndex = new Map(tableColumns.map((name, i) => [name, i]));
+                for (let byte = 0; byte < saved.length; byte++) {
+                    if (!saved[byte]) {
+                        continue;
+                    }
+                    for (let bit = 0; bit < 8; bit++) {
+                        const index = byte * 8 + bit;
+                        if (!getBit(saved, index)) {
+                            continue;
+                        }
+                        const row = rowIndex.get(rows[Math.floor(index / columns.length)]);
+                        const column = columnIndex.get(columns[index % columns.length]);
+                        if (row !== undefined && column !== undefined) {
+                            setBit(bits, row * tableColumns.length + column, 1);
+                        }
+                    }
                 }
+                return bits;
             }
             
-            // Pre-selected images from repository
-            const preSelectedImages = {selected_images_json};
+            function toTableBits(record) {
+                return toBits(record, TABLE_ROWS, TABLE_COLUMNS);
+            }
+            
+            function selectionRecord() {
+                return {version: 2, rows: TABLE_ROWS, columns: TABLE_COLUMNS, bits: encodeBits(selectionBits)};
+            }
+            
+            function storedRecord() {
+                const stored = localStorage.getItem(STORAGE_KEY);
+                return stored ? JSON.parse(stored) : null;
+            }
+            
+            // The whole selection lives in a single localStorage key, shared by
+            // every open tab and every shard of the table. Changes, as
+            // [row name, column name, selected], are applied to the record as
+            // stored right now, so what other pages saved meanwhile is kept.
+            function saveSelections(changes) {
+                const record = storedRecord();
+                const rows = record && record.rows ? record.rows.slice() : TABLE_ROWS.slice();
+                const columns = record && record.columns ? record.columns.slice() : TABLE_COLUMNS.slice();
+                // Names the record does not know yet are appended to its axes
+                const knownRows = new Set(rows);
+                const knownColumns = new Set(columns);
+                for (const [row, column, selected] of changes) {
+                    if (selected && !knownRows.has(row)) {
+                        knownRows.add(row);
+                        rows.push(row);
+                    }
+                    if (selected && !knownColumns.has(column)) {
+                        knownColumns.add(column);
+                        columns.push(column);
+                    }
+                }
+                
+                const bits = toBits(record, rows, columns);
+                const rowIndex = new Map(rows.map((name, i) => [name, i]));
+                const columnIndex = new Map(columns.map((name, i) => [name, i]));
+                for (const [row, column, selected] of changes) {
+                    if (rowIndex.has(row) && columnIndex.has(column)) {
+                        setBit(bits, rowIndex.get(row) * columns.length + columnIndex.get(column), selected);
+                    }
+                }
+                const updated = {version: 2, rows: rows, columns: columns, bits: encodeBits(bits)};
+                localStorage.setItem(STORAGE_KEY, JSON.stringify(updated));
+                selectionBits = toTableBits(updated);
+            }
+            
+            // Mark the selected cells of the table
+            function showSelections() {
+                for (let index = 0; index < CELL_COUNT; index++) {
+                    const row = Math.floor(index / TABLE_COLUMNS.length);
+                    const img = document.getElementById(`cell_${row}_${index % TABLE_COLUMNS.length}`);
+                    if (img) {
+                        img.classList.toggle('selected', getBit(selectionBits, index) === 1);
+                    }
+                }
+            }
+            
+            // Function to toggle image selection
+            function toggleSelection(row, column) {
+                const selected = !getBit(selectionBits, row * TABLE_COLUMNS.length + column);
+                saveSelections([[TABLE_ROWS[row], TABLE_COLUMNS[column], selected]]);
+                document.getElementById(`cell_${row}_${column}`).classList.toggle('selected', selected);
+            }
+            
+            // Pre-selected images from repository, loaded at runtime so that
+            // updating selections.json never requires rebuilding this page
+            async function loadPreSelections() {
+                try {
+                    const response = await fetch('{selections_url}', {cache: 'no-cache'});
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return await response.json();
+                } catch (error) {
+                    // Opened from disk: fall back to the selections.js sidecar
+                    return window.preSelections || null;
+                }
+            }
+            
+            // Selections stored one key per image by older versions of this page
+            function migrateLegacySelections() {
+                const legacy = {selected_images: []};
+                for (let i = localStorage.length - 1; i >= 0; i--) {
+                    const key = localStorage.key(i);
+                    if (key && key.startsWith('img_')) {
+                        if (localStorage.getItem(key) === 'selected') {
+                            legacy.selected_images.push(key);
+                        }
+                        localStorage.removeItem(key);
+                    }
+                }
+                return toTableBits(legacy);
+            }
             
             // Function to restore selections from localStorage and pre-selected images
-            function restoreSelections() {
-                const images = document.querySelectorAll('img[id^="img_"]');
-                images.forEach(img => {
-                    const imageId = img.id;
-                    // Check localStorage first, then pre-selected images
-                    if (localStorage.getItem(imageId) === 'selected' || preSelectedImages[imageId]) {
-                        img.classList.add('selected');
-                        // Also store in localStorage for consistency
-                        localStorage.setItem(imageId, 'selected');
+            async function restoreSelections() {
+                const added = toTableBits(await loadPreSelections());
+                const record = storedRecord();
+                if (!record) {
+                    const legacy = migrateLegacySelections();
+                    for (let byte = 0; byte < added.length; byte++) {
+                        added[byte] |= legacy[byte];
                     }
-                });
+                }
+                selectionBits = toTableBits(record);
+                
+                // Pre-selections missing from localStorage are stored there too
+                const changes = [];
+                for (let index = 0; index < CELL_COUNT; index++) {
+                    if (getBit(added, index) && !getBit(selectionBits, index)) {
+                        const row = Math.floor(index / TABLE_COLUMNS.length);
+                        changes.push([TABLE_ROWS[row], TABLE_COLUMNS[index % TABLE_COLUMNS.length], true]);
+                    }
+                }
+                if (changes.length) {
+                    saveSelections(changes);
+                }
+                showSelections();
             }
             
+            // Keep in step with the selections made in other tabs
+            window.addEventListener('storage', function(e) {
+                if (e.key === STORAGE_KEY || e.key === null) {
+                    selectionBits = toTableBits(storedRecord());
+                    showSelections();
+                }
+            });
+            
             // Restore selections when page loads
             document.addEventListener('DOMContentLoaded', restoreSelections);
             
-            // Optional: Add keyboard shortcut to clear all selections (Ctrl+Shift+C)
             document.addEventListener('keydown', function(e) {
+                // Optional: Add keyboard shortcut to clear all selections (Ctrl+Shift+C)
+                // Only the cells of this table are cleared, other shards keep theirs
                 if (e.ctrlKey && e.shiftKey && e.key === 'C') {
-                    const selectedImages = document.querySelectorAll('img.selected');
-                    selectedImages.forEach(img => {
-                        img.classList.remove('selected');
-                        localStorage.removeItem(img.id);
-                    });
+                    saveSelections(TABLE_ROWS.flatMap(row => TABLE_COLUMNS.map(column => [row, column, false])));
+                    showSelections();
                     console.log('All selections cleared');
                 }
+                // Export the selections as selectedimages.txt (Ctrl+Shift+E),
+                // then run: python merge_selections.py selectedimages.txt
+                if (e.ctrlKey && e.shiftKey && e.key === 'E') {
+                    const blob = new Blob([JSON.stringify(selectionRecord())], {type: 'text/plain'});
+                    const link = document.createElement('a');
+                    link.href = URL.createObjectURL(blob);
+                    link.download = 'selectedimages.txt';
+                    link.click();
+                    URL.revokeObjectURL(link.href);
+                }
             });
         </script>
+        <script src="{selections_sidecar_url}"></script>
         
     </body>
     </html>
     """
-    
-    # Replace placeholder with actual selected images JSON
-    selected_images_dict = {image_id: True for image_id in selected_images}
-    selected_images_json = json.dumps(selected_images_dict)
-    html_content = html_content.replace('{selected_images_json}', selected_images_json)
-    
-    # Write HTML file
-    with open(output_html, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    print(f"Interactive HTML table created: {output_html}")
-    print(f"Found {len(folders)} folders and {len(image_names)} images")
+        
+        # Replace placeholders with the table axes and the location of the selections files
+        html_content = html_content.replace('{table_rows_json}', json.dumps(self.image_names))
+        html_content = html_content.replace('{table_columns_json}', json.dumps(self.folders))
+        html_content = html_content.replace('{selections_url}', self.selections_url)
+        html_content = html_content.replace('{selections_sidecar_url}', self.selections_sidecar_url)
+        self.out.write(html_content)
+
+def build_interactive_table_html(base_folder, selections_url="selections.json", image_src=None,
+                                 excel_data=None, rows=None, columns=None,
+                                 title="Interactive Image Comparison Table", jobs=None, pool=None):
+    """
+    Build the HTML of the interactive table. Returns (html, folders, image_names).
+    base_folder is the images_test_tiles folder or a tile pack built by tile_pack.py.
+    rows and columns restrict the page to some image names and folders; cells
+    keep the indices of the whole tree so every page shares the same selections.
+    See InteractiveTableSink for selections_url and image_src.
+    """
+    out = StringIO()
+    sink = InteractiveTableSink(out, selections_url, image_src, title)
+    folders, image_names, _, _ = run_pipeline(base_folder, [sink], rows, columns, metadata=excel_data,
+                                              jobs=jobs, pool=pool)
+    return out.getvalue(), folders, image_names
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the interactive image comparison table")
+    parser.add_argument('--shard-by', choices=list(SHARD_LABELS),
+                        help="write one page per building group, parameter family or both, plus an index page")
+    parser.add_argument('--output-dir', help="where to write the sharded pages (default: interactive_table/)")
+    parser.add_argument('--jobs', type=int, default=None, help="number of worker processes decoding the tiles")
+    parser.add_argument('--pack', help="read the tiles from a pack built by tile_pack.py instead of the folders")
+    parser.add_argument('--memory-limit', type=int, default=MEMORY_LIMIT_MB,
+                        help="memory in MB a single image decode may use in each worker")
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+    
     # Get the directory where this script is located
     script_dir = os.path.dirname(os.path.abspath(__file__))
     
@@ -463,11 +796,20 @@ if __name__ == "__main__":
     print(f"Running from: {os.getcwd()}")
     print(f"Script location: {script_dir}")
     print(f"Base folder: {base_folder}")
-    print(f"Output file: {output_html}")
+    set_memory_limit(args.memory_limit)
     
-    # Load selections from file
-    selections_file = os.path.join(os.path.dirname(output_html), "selections.json")
-    selected_images = load_selections(selections_file)
-    print(f"Loaded {len(selected_images)} selected images from {selections_file}")
+    # A tile pack replaces the folders: one file, memory-mapped
+    if args.pack:
+        base_folder = args.pack
+        print(f"Tile pack: {base_folder}")
     
-    create_interactive_image_table(base_folder, output_html, selected_images)
+    if args.shard_by:
+        output_dir = args.output_dir or os.path.join(os.path.dirname(output_html), "interactive_table")
+        print(f"Output folder: {output_dir}")
+        create_sharded_image_tables(base_folder, output_dir, args.shard_by, jobs=args.jobs,
+                                    memory_limit_mb=args.memory_limit, row_filter=filter_from_arguments(args))
+    else:
+        print(f"Output file: {output_html}")
+        # selections.json next to the HTML is loaded by the page itself
+        create_interactive_image_table(base_folder, output_html, jobs=args.jobs, memory_limit_mb=args.memory_limit,
+                                       row_filter=filter_from_arguments(args))
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Local preview server for the interactive table.
+Usage: python preview_server.py [--port 8000] [--cache-dir DIR] [--cache-max-mb 2048] [--no-watch]
+
+The table is served with thumbnail URLs instead of embedded base64 images.
+Thumbnails are resized on demand and kept in an in-memory LRU cache in front
+of the shared tile store (cached on disk by source hash, least recently used
+files pruned beyond --cache-max-mb), and the tile folders are watched so that
+new or changed tiles are re-encoded and pushed to the open page without
+regenerating anything.
+File system notifications use watchdog when it is installed, otherwise the
+folders are polled.
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from make_interactive_table import build_interactive_table_html
+from tile_pack import IMAGE_EXTENSIONS
+from tile_store import DEFAULT_CACHE_DIR, TileStore, content_type, derivative_kinds
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+# Pushes tile updates from the server to the open page
+LIVE_RELOAD_SCRIPT = """
+        <script>
+            const tileEvents = new EventSource('/events');
+            tileEvents.onmessage = function(e) {
+                const message = JSON.parse(e.data);
+                if (message.reload) {
+                    location.reload();
+                    return;
+                }
+                const row = TABLE_ROWS.indexOf(message.image);
+                const column = TABLE_COLUMNS.indexOf(message.folder);
+                const img = document.getElementById(`cell_${row}_${column}`);
+                if (img) {
+                    img.src = message.src;
+                } else {
+                    location.reload();
+                }
+            };
+        </script>
+"""
+
+
+def tile_version(image_path):
+    """
+    Cheap version of a tile, changes whenever the file is rewritten.
+    """
+    stat = os.stat(image_path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+class ThumbnailCache:
+    """
+    LRU cache of encoded thumbnails in memory, in front of the tile store.
+    Keys are those of the tile store, so a changed tile never hits a stale entry.
+    """
+
+    def __init__(self, store, max_bytes=256 * 1024 * 1024):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, folder_name, image_name, kind):
+        """
+        Return (key, png bytes) of a derivative.
+        """
+        key = self.store.cache_key(self.store.tiles.hash(folder_name, image_name), kind)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return key, self.entries[key]
+
+        data = self.store.get(folder_name, image_name, kind)
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = data
+                self.size += len(data)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+        return key, data
+
+
+class TilePreview:
+    """
+    State shared by the request handlers: the tile tree, the cached page,
+    the thumbnail cache and the pages listening for updates.
+    """
+
+    def __init__(self, base_folder, cache_dir, max_cache_bytes=None):
+        self.base_folder = base_folder
+        self.store = TileStore(base_folder, cache_dir, max_cache_bytes=max_cache_bytes)
+        self.thumbnails = ThumbnailCache(self.store)
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.page = None
+        self.axes = None
+
+    def image_path(self, folder_name, image_name):
+        return os.path.join(self.base_folder, folder_name, image_name)
+
+    def thumbnail_url(self, folder_name, image_name):
+        version = tile_version(self.image_path(folder_name, image_name))
+        return f"/thumb/{quote(folder_name)}/{quote(image_name)}?v={version}"
+
+    def get_page(self):
+        with self.lock:
+            if self.page is None:
+                html, folders, image_names = build_interactive_table_html(
+                    self.base_folder, image_src=self.thumbnail_url)
+                self.page = html.replace('    </body>', LIVE_RELOAD_SCRIPT + '    </body>', 1).encode('utf-8')
+                self.axes = (set(folders), set(image_names))
+                print(f"Table rebuilt: {len(folders)} folders and {len(image_names)} images")
+            return self.page
+
+    def get_thumbnail(self, folder_name, image_name, kind='thumbnail'):
+        """
+        Return (etag, png bytes) of a thumbnail.
+        """
+        return self.thumbnails.get(folder_name, image_name, kind)
+
+    def subscribe(self):
+        listener = queue.Queue()
+        with self.lock:
+            self.listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            self.listeners.remove(listener)
+
+    def publish(self, message):
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener.put(message)
+
+    def tile_changed(self, image_path):
+        """
+        Re-encode a new or changed tile and push it to the open pages.
+        New folders or new image names change the table layout, so the
+        page is rebuilt and reloaded instead.
+        """
+        folder_name = os.path.basename(os.path.dirname(image_path))
+        image_name = os.path.basename(image_path)
+        if not image_name.lower().endswith(IMAGE_EXTENSIONS) or not os.path.exists(image_path):
+            return
+
+        with self.lock:
+            axes = self.axes
+        if axes is None:
+            return
+        if folder_name not in axes[0] or image_name not in axes[1]:
+            with self.lock:
+                self.page = None
+            self.publish({"reload": True})
+            return
+
+        try:
+            self.get_thumbnail(folder_name, image_name)
+        except Exception as e:
+            print(f"Error encoding {image_path}: {e}")
+            return
+        print(f"Updated {folder_name}/{image_name}")
+        self.publish({
+            "folder": folder_name,
+            "image": image_name,
+            "src": self.thumbnail_url(folder_name, image_name),
+        })
+
+    def tiles_removed(self):
+        with self.lock:
+            self.page = None
+        self.publish({"reload": True})
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    preview = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_bytes(self, data, content_type, cache_control="no-cache", etag=None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", cache_control)
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = unquote(url.path)
+
+        if path in ('/', '/index.html', '/interactive_image_table.html'):
+            self.send_bytes(self.preview.get_page(), "text/html; charset=utf-8")
+        elif path.startswith('/thumb/'):
+            self.send_thumbnail(path[len('/thumb/'):], parse_qs(url.query))
+        elif path in ('/selections.json', '/selections.js'):
+            self.send_project_file(path[1:])
+        elif path == '/events':
+            self.send_events()
+        else:
+            self.send_error(404)
+
+    def send_thumbnail(self, tile, query):
+        folder_name, _, image_name = tile.partition('/')
+        if (not folder_name or not image_name or '/' in image_name
+                or folder_name.startswith('.') or image_name.startswith('.')
+                or not os.path.exists(self.preview.image_path(folder_name, image_name))):
+            self.send_error(404)
+            return
+
+        kind = query.get('kind', ['thumbnail'])[0]
+        if kind not in derivative_kinds(folder_name):
+            self.send_error(404)
+            return
+        try:
+            key, data = self.preview.get_thumbnail(folder_name, image_name, kind)
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+
+        etag = f'"{key}"'
+        # Thumbnail URLs carry the tile version, so they can be cached for good
+        cache_control = "public, max-age=31536000, immutable" if 'v' in query else "no-cache"
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", cache_control)
+            self.end_headers()
+            return
+        self.send_bytes(data, content_type(kind), cache_control, etag)
+
+    def send_project_file(self, name):
+        file_path = os.path.join(PROJECT_ROOT, name)
+        if not os.path.exists(file_path):
+            self.send_error(404)
+            return
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        content_type = "application/json" if name.endswith('.json') else "text/javascript"
+        self.send_bytes(data, content_type)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        listener = self.preview.subscribe()
+        try:
+            while True:
+                try:
+                    message = listener.get(timeout=15)
+                    self.wfile.write(f"data: {json.dumps(message)}\n\n".encode())
+                except queue.Empty:
+                    # Keep the connection alive
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.preview.unsubscribe(listener)
+
+
+def watch_with_notifications(preview):
+    """
+    Watch the tile folders with watchdog (inotify, FSEvents, ReadDirectoryChangesW).
+    """
+    class TileEventHandler(FileSystemEventHandler):
+        def on_created(self, event):
+            if not event.is_directory:
+                preview.tile_changed(event.src_path)
+
+        def on_modified(self, event):
+            if not event.is_directory:
+                preview.tile_changed(event.src_path)
+
+        def on_moved(self, event):
+            if not event.is_directory:
+                preview.tile_changed(event.dest_path)
+
+        def on_deleted(self, event):
+            if event.is_directory or event.src_path.lower().endswith(IMAGE_EXTENSIONS):
+                preview.tiles_removed()
+
+    observer = Observer()
+    observer.schedule(TileEventHandler(), preview.base_folder, recursive=True)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+def snapshot_tiles(base_folder):
+    """
+    Map every tile path to its version.
+    """
+    tiles = {}
+    for folder in os.scandir(base_folder):
+        if not folder.is_dir() or folder.name.startswith('.') or folder.name == '__pycache__':
+            continue
+        for entry in os.scandir(folder.path):
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                stat = entry.stat()
+                tiles[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return tiles
+
+
+def watch_with_polling(preview, interval=1.0):
+    """
+    Fallback when watchdog is not installed: compare folder snapshots.
+    """
+    def poll():
+        previous = snapshot_tiles(preview.base_folder)
+        while True:
+            time.sleep(interval)
+            current = snapshot_tiles(preview.base_folder)
+            if set(previous) - set(current):
+                preview.tiles_removed()
+            for image_path, version in current.items():
+                if previous.get(image_path) != version:
+                    preview.tile_changed(image_path)
+            previous = current
+
+    thread = threading.Thread(target=poll, daemon=True)
+    thread.start()
+    return thread
+
+
+def prune_periodically(preview, interval=60.0):
+    """
+    Keep the on-disk tile cache within its size bound.
+    """
+    def prune():
+        while True:
+            removed = preview.store.prune()
+            if removed:
+                print(f"Pruned {removed} files from the tile cache")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=prune, daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the interactive table with live tile updates")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-folder', default=SCRIPT_DIR, help="folder containing the tile folders")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="where encoded thumbnails are kept between runs")
+    parser.add_argument('--cache-max-mb', type=int, default=2048,
+                        help="size of the thumbnail cache on disk, least recently used files go first")
+    parser.add_argument('--no-watch', action='store_true', help="do not watch the tile folders")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.base_folder, "google_earth_images")):
+        print("Error: Cannot find 'google_earth_images' folder")
+        print("Base folder:", args.base_folder)
+        exit(1)
+
+    preview = TilePreview(args.base_folder, args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    PreviewHandler.preview = preview
+    prune_periodically(preview)
+
+    if not args.no_watch:
+        if Observer is not None:
+            watch_with_notifications(preview)
+            print("Watching tile folders for changes")
+        else:
+            watch_with_polling(preview)
+            print("Watching tile folders for changes (polling, install watchdog for notifications)")
+
+    server = ThreadingHTTPServer((args.host, args.port), PreviewHandler)
+    server.daemon_threads = True
+    print(f"Serving the interactive table on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Headless renderer that turns LOD2 CityJSON reconstructions into comparison tiles.
+
+Expected input layout (one folder per parameter configuration):
+
+    <input_root>/cd20cf05pdk5pmp30eps03/3_B_bis.city.json
+    <input_root>/cd20cf05pdk5pmp30eps03/4_A.json
+    ...
+
+Each file is rendered to <output_root>/<configuration>/<building>.png, which is
+exactly the layout make_interactive_table.py and make_eval_table.py expect.
+Usage: python render_tiles.py <input_root> [output_root] [--size 1080] [--jobs N]
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from building_metadata import BuildingIndex, add_filter_arguments, load_excel_data
+
+# Semantic surface colours (RGB), close to the ones used by the external viewer
+SURFACE_COLOURS = {
+    'RoofSurface': (130, 194, 255),
+    'WallSurface': (120, 176, 235),
+    'GroundSurface': (150, 150, 150),
+    'ClosureSurface': (200, 200, 200),
+    'OuterCeilingSurface': (130, 194, 255),
+    'OuterFloorSurface': (150, 150, 150),
+    '+ThermalBridge': (220, 53, 69),
+}
+DEFAULT_COLOUR = (180, 180, 180)
+
+CITYJSON_EXTENSIONS = ('.city.json', '.json')
+
+
+def load_faces(cityjson_path, lod='2'):
+    """
+    Read a CityJSON file and return its polygons as a list of
+    (vertices as an (n, 3) array, semantic surface type) tuples.
+    Only geometries of the requested LoD are kept.
+    """
+    with open(cityjson_path, 'r', encoding='utf-8') as f:
+        cm = json.load(f)
+
+    vertices = np.asarray(cm.get('vertices', []), dtype=np.float64)
+    if 'transform' in cm and len(vertices):
+        vertices = vertices * np.asarray(cm['transform']['scale']) + np.asarray(cm['transform']['translate'])
+
+    faces = []
+    for city_object in cm.get('CityObjects', {}).values():
+        for geometry in city_object.get('geometry', []):
+            if str(geometry.get('lod', '')).split('.')[0] != lod:
+                continue
+
+            semantics = geometry.get('semantics', {})
+            surfaces = semantics.get('surfaces', [])
+            values = semantics.get('values')
+            geometry_type = geometry['type']
+
+            # Flatten every geometry type down to a list of surfaces
+            if geometry_type in ('MultiSurface', 'CompositeSurface'):
+                boundaries = [geometry['boundaries']]
+                values = [values] if values else None
+            elif geometry_type == 'Solid':
+                boundaries = geometry['boundaries']
+            elif geometry_type in ('MultiSolid', 'CompositeSolid'):
+                boundaries = [shell for solid in geometry['boundaries'] for shell in solid]
+                values = [shell for solid in values for shell in solid] if values else None
+            else:
+                continue
+
+            for shell_index, shell in enumerate(boundaries):
+                for surface_index, surface in enumerate(shell):
+                    if not surface or len(surface[0]) < 3:
+                        continue
+                    surface_type = None
+                    if values:
+                        semantic_index = values[shell_index][surface_index]
+                        if semantic_index is not None:
+                            surface_type = surfaces[semantic_index].get('type')
+                    # Only the exterior ring is drawn, LOD2 roofs and walls rarely have holes
+                    faces.append((vertices[surface[0]], surface_type))
+    return faces
+
+
+def view_matrix(azimuth=45.0, elevation=35.0):
+    """
+    Rotation matrix for an axonometric view looking down at the building.
+    """
+    az = np.radians(azimuth)
+    el = np.radians(elevation)
+    rot_z = np.array([[np.cos(az), -np.sin(az), 0],
+                      [np.sin(az), np.cos(az), 0],
+                      [0, 0, 1]])
+    rot_x = np.array([[1, 0, 0],
+                      [0, np.sin(el), np.cos(el)],
+                      [0, -np.cos(el), np.sin(el)]])
+    return rot_x @ rot_z
+
+
+def face_normal(polygon):
+    """
+    Normal of a ring (not normalized), pointing outwards for CityJSON's
+    counter-clockwise exterior rings. Newell's method is robust for
+    non-planar rings.
+    """
+    nxt = np.roll(polygon, -1, axis=0)
+    return np.array([
+        np.sum((polygon[:, 1] - nxt[:, 1]) * (polygon[:, 2] + nxt[:, 2])),
+        np.sum((polygon[:, 2] - nxt[:, 2]) * (polygon[:, 0] + nxt[:, 0])),
+        np.sum((polygon[:, 0] - nxt[:, 0]) * (polygon[:, 1] + nxt[:, 1])),
+    ])
+
+
+def point_in_ring(point, ring):
+    """
+    Even-odd test of a 2D point against a 2D ring.
+    """
+    x, y = point
+    xs, ys = ring[:, 0], ring[:, 1]
+    nxt_x, nxt_y = np.roll(xs, -1), np.roll(ys, -1)
+    crosses = (ys > y) != (nxt_y > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        at_x = xs + (y - ys) * (nxt_x - xs) / (nxt_y - ys)
+    return bool(np.count_nonzero(crosses & (x < at_x)) % 2)
+
+
+def bridge_hosts(faces, normals, tolerance=0.05):
+    """
+    Thermal bridge index -> index of the surface it lies on: the first other
+    surface in the same plane, within tolerance meters, whose ring holds the
+    bridge's centre. Bridges without such a surface are left out.
+    """
+    units = [n / np.linalg.norm(n) if n.any() else n for n in normals]
+    hosts = {}
+    for i, (polygon, surface_type) in enumerate(faces):
+        if surface_type != '+ThermalBridge' or not units[i].any():
+            continue
+        centre = polygon.mean(axis=0)
+        for j, (host, host_type) in enumerate(faces):
+            if host_type == '+ThermalBridge' or abs(units[i] @ units[j]) < 0.99:
+                continue
+            if abs((centre - host[0]) @ units[j]) > tolerance:
+                continue
+            # Drop the normal's main axis and test in the plane
+            axes = [a for a in range(3) if a != np.argmax(np.abs(units[j]))]
+            if point_in_ring(centre[axes], host[:, axes]):
+                hosts[i] = j
+                break
+    return hosts
+
+
+def render_faces(faces, size=1080, margin=0.1, azimuth=45.0, elevation=35.0, supersample=2):
+    """
+    Rasterize faces to an RGBA tile with a painter's algorithm and Lambert shading.
+    """
+    canvas_size = size * supersample
+    img = Image.new('RGBA', (canvas_size, canvas_size), (255, 255, 255, 0))
+    if not faces:
+        return img.resize((size, size), Image.Resampling.LANCZOS)
+
+    rotation = view_matrix(azimuth, elevation)
+    light = np.array([0.4, -0.3, 0.87])
+    light /= np.linalg.norm(light)
+
+    # Project every vertex in one go, then split back per face
+    counts = np.array([len(v) for v, _ in faces])
+    all_points = np.concatenate([v for v, _ in faces]) @ rotation.T
+    lo = all_points[:, :2].min(axis=0)
+    hi = all_points[:, :2].max(axis=0)
+    extent = max(hi[0] - lo[0], hi[1] - lo[1]) or 1.0
+    scale = canvas_size * (1 - 2 * margin) / extent
+    offset = (canvas_size - (hi[:2] - lo[:2]) * scale) / 2
+
+    screen = np.empty((len(all_points), 2))
+    screen[:, 0] = (all_points[:, 0] - lo[0]) * scale + offset[0]
+    screen[:, 1] = canvas_size - ((all_points[:, 1] - lo[1]) * scale + offset[1])
+    depth = all_points[:, 2]
+
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    normals = [face_normal(polygon) for polygon, _ in faces]
+
+    # Back to front. A thermal bridge lies on its host surface: it is sorted
+    # with the host's depth and drawn right after it, so whatever hides the
+    # host hides the bridge too.
+    face_depths = [depth[bounds[i]:bounds[i + 1]].mean() for i in range(len(faces))]
+    hosts = bridge_hosts(faces, normals)
+    order = [i for *_, i in sorted(
+        (face_depths[hosts[i]], 1, i) if i in hosts else (face_depths[i], 0, i)
+        for i in range(len(faces)))]
+
+    draw = ImageDraw.Draw(img)
+    line_width = max(1, 2 * supersample)
+    for i in order:
+        polygon, surface_type = faces[i]
+        start, end = bounds[i], bounds[i + 1]
+
+        normal = normals[i]
+        norm = np.linalg.norm(normal)
+        shade = 0.55 + 0.45 * abs(normal @ light) / norm if norm else 1.0
+
+        colour = SURFACE_COLOURS.get(surface_type, DEFAULT_COLOUR)
+        points = [tuple(p) for p in screen[start:end]]
+        if surface_type == '+ThermalBridge':
+            draw.polygon(points, fill=colour + (255,))
+            draw.line(points + [points[0]], fill=colour + (255,), width=line_width)
+        else:
+            fill = tuple(int(c * shade) for c in colour) + (255,)
+            draw.polygon(points, fill=fill)
+
+    return img.resize((size, size), Image.Resampling.LANCZOS)
+
+
+def render_tile(cityjson_path, output_path, size=1080, lod='2'):
+    """
+    Render one CityJSON file to a PNG tile. Returns the output path.
+    """
+    img = render_faces(load_faces(cityjson_path, lod), size=size)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    img.save(output_path, 'PNG')
+    return output_path
+
+
+def building_name(file_name):
+    """
+    3_B_bis.city.json -> 3_B_bis
+    """
+    for extension in CITYJSON_EXTENSIONS:
+        if file_name.lower().endswith(extension):
+            return file_name[:-len(extension)]
+    return None
+
+
+def find_render_jobs(input_root, output_root, force=False, names=None):
+    """
+    List (source, destination) pairs for every building x configuration.
+    Tiles newer than their CityJSON source are skipped unless force is set,
+    buildings missing from names are skipped when names is given.
+    """
+    jobs = []
+    for configuration in sorted(os.listdir(input_root)):
+        config_path = os.path.join(input_root, configuration)
+        if not os.path.isdir(config_path):
+            continue
+        for file_name in sorted(os.listdir(config_path)):
+            name = building_name(file_name)
+            if name is None or (names is not None and name not in names):
+                continue
+            source = os.path.join(config_path, file_name)
+            destination = os.path.join(output_root, configuration, f"{name}.png")
+            if (not force and os.path.exists(destination)
+                    and os.path.getmtime(destination) >= os.path.getmtime(source)):
+                continue
+            jobs.append((source, destination))
+    return jobs
+
+
+def render_sweep(input_root, output_root, size=1080, jobs=None, force=False, names=None):
+    """
+    Render every building (or those in names) of every configuration in parallel.
+    """
+    render_jobs = find_render_jobs(input_root, output_root, force, names)
+    print(f"Rendering {len(render_jobs)} tiles from {input_root}")
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(render_tile, source, destination, size): source
+                   for source, destination in render_jobs}
+        for future in as_completed(futures):
+            try:
+                print(f"Rendered {future.result()}")
+            except Exception as e:
+                failures += 1
+                print(f"Error rendering {futures[future]}: {e}")
+
+    print(f"Done: {len(render_jobs) - failures} rendered, {failures} failed")
+    return failures == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render LOD2 CityJSON buildings to comparison tiles")
+    parser.add_argument('input_root', help="folder containing one sub-folder of CityJSON files per configuration")
+    parser.add_argument('output_root', nargs='?', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="where to write the tiles (default: images_test_tiles)")
+    parser.add_argument('--size', type=int, default=1080, help="tile width and height in pixels")
+    parser.add_argument('--jobs', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--force', action='store_true', help="re-render tiles that are up to date")
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_root):
+        print(f"Error: {args.input_root} is not a directory")
+        exit(1)
+
+    # Buildings picked from the Excel sheet by area or typology
+    names = None
+    if args.bbox is not None or args.near is not None or args.typology is not None:
+        names = BuildingIndex(load_excel_data()).select(args.bbox, args.near, args.typology)
+        print(f"Selected {len(names)} buildings")
+
+    if not render_sweep(args.input_root, args.output_root, args.size, args.jobs, args.force, names):
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Single-file tile pack, so builds open one file instead of hundreds of PNGs.
+Usage: python tile_pack.py [base_folder] [output_pack]
+
+Layout of a pack:
+
+    b'TPAK' | version (uint32) | index length (uint64) | index (JSON) | tile bytes...
+
+The index lists the folders and image names in table order, and for every
+tile its offset, length, SHA-1 and dimensions:
+
+    {"folders": [...], "images": [...],
+     "tiles": {"folder/image.png": [offset, length, sha1, width, height]}}
+
+TilePack reads tiles through mmap and answers dimensions from the index, so
+nothing is decoded until an image is actually needed. TileDirectory offers the
+same interface over the images_test_tiles folders; open_tile_source() picks
+one or the other, which is what the table builders use.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+from io import BytesIO
+
+from PIL import Image
+
+PACK_MAGIC = b'TPAK'
+PACK_VERSION = 1
+PACK_HEADER = struct.Struct('<4sIQ')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tiff')
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def image_dimensions(data):
+    """
+    Width and height of an encoded image, read from its header only.
+    """
+    if data[:8] == PNG_SIGNATURE and data[12:16] == b'IHDR':
+        return struct.unpack('>II', data[16:24])
+    # Image.open only parses the header, the pixels are not decoded
+    return Image.open(BytesIO(data)).size
+
+
+def scan_folders(base_folder):
+    """
+    Return (folders, image_names) in table order: sorted, google_earth_images first.
+    """
+    folders = sorted(f for f in os.listdir(base_folder)
+                     if os.path.isdir(os.path.join(base_folder, f))
+                     and f != '__pycache__' and not f.startswith('.'))
+    if 'google_earth_images' in folders:
+        folders.remove('google_earth_images')
+        folders.insert(0, 'google_earth_images')
+    if not folders:
+        return [], []
+
+    image_names = sorted(f for f in os.listdir(os.path.join(base_folder, folders[0]))
+                         if f.lower().endswith(IMAGE_EXTENSIONS))
+    return folders, image_names
+
+
+class TileDirectory:
+    """
+    Tiles read straight from the images_test_tiles folders.
+    """
+
+    def __init__(self, base_folder):
+        self.base_folder = base_folder
+        self._folders, self._image_names = scan_folders(base_folder)
+        self._hashes = {}
+
+    def folders(self):
+        return list(self._folders)
+
+    def image_names(self):
+        return list(self._image_names)
+
+    def path(self, folder_name, image_name):
+        return os.path.join(self.base_folder, folder_name, image_name)
+
+    def exists(self, folder_name, image_name):
+        return os.path.exists(self.path(folder_name, image_name))
+
+    def read(self, folder_name, image_name):
+        with open(self.path(folder_name, image_name), 'rb') as f:
+            return f.read()
+
+    def size(self, folder_name, image_name):
+        with Image.open(self.path(folder_name, image_name)) as img:
+            return img.size
+
+    def hash(self, folder_name, image_name):
+        # Remembered until the file changes, long-running callers ask repeatedly
+        path = self.path(folder_name, image_name)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, hashlib.sha1(self.read(folder_name, image_name)).hexdigest())
+            self._hashes[path] = cached
+        return cached[1]
+
+    def open_image(self, folder_name, image_name):
+        return Image.open(self.path(folder_name, image_name))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TilePack:
+    """
+    Tiles read from a pack file through mmap.
+    """
+
+    def __init__(self, pack_path):
+        self.pack_path = pack_path
+        self._file = open(pack_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, index_length = PACK_HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self.close()
+            raise ValueError(f"{pack_path} is not a tile pack (version {PACK_VERSION})")
+        start = PACK_HEADER.size
+        index = json.loads(self._map[start:start + index_length].decode('utf-8'))
+
+        self._folders = index['folders']
+        self._image_names = index['images']
+        self._tiles = index['tiles']
+
+    def folders(self):
+        return list(self._folders)
+
+    def image_names(self):
+        return list(self._image_names)
+
+    def exists(self, folder_name, image_name):
+        return f"{folder_name}/{image_name}" in self._tiles
+
+    def _entry(self, folder_name, image_name):
+        try:
+            return self._tiles[f"{folder_name}/{image_name}"]
+        except KeyError:
+            raise FileNotFoundError(f"{folder_name}/{image_name} is not in {self.pack_path}") from None
+
+    def read(self, folder_name, image_name):
+        offset, length = self._entry(folder_name, image_name)[:2]
+        return self._map[offset:offset + length]
+
+    def size(self, folder_name, image_name):
+        return tuple(self._entry(folder_name, image_name)[3:5])
+
+    def hash(self, folder_name, image_name):
+        return self._entry(folder_name, image_name)[2]
+
+    def open_image(self, folder_name, image_name):
+        return Image.open(BytesIO(self.read(folder_name, image_name)))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_tile_source(tiles):
+    """
+    Open a pack file or a tiles folder. Tile sources are passed through as is.
+    """
+    if not isinstance(tiles, (str, os.PathLike)):
+        return tiles
+    if os.path.isfile(tiles):
+        return TilePack(tiles)
+    return TileDirectory(tiles)
+
+
+def build_tile_pack(base_folder, output_pack):
+    """
+    Pack every tile of base_folder into output_pack.
+    """
+    folders, image_names = scan_folders(base_folder)
+
+    # Collect the tiles first: the index goes in front of the data
+    tiles = []
+    for folder_name in folders:
+        folder_path = os.path.join(base_folder, folder_name)
+        for image_name in sorted(os.listdir(folder_path)):
+            if image_name.lower().endswith(IMAGE_EXTENSIONS):
+                tiles.append((folder_name, image_name, os.path.join(folder_path, image_name)))
+
+    # Tile bytes are staged in a temporary file so every source is read once
+    entries = {}
+    temp_data = output_pack + ".data.tmp"
+    with open(temp_data, 'wb') as data_file:
+        for folder_name, image_name, image_path in tiles:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            width, height = image_dimensions(data)
+            entries[f"{folder_name}/{image_name}"] = [0, len(data), hashlib.sha1(data).hexdigest(), width, height]
+            data_file.write(data)
+
+    # Offsets depend on the index length, which depends on the offsets:
+    # recompute them until the encoded index stops growing
+    index_length = 0
+    while True:
+        offset = PACK_HEADER.size + index_length
+        for entry in entries.values():
+            entry[0] = offset
+            offset += entry[1]
+        index = json.dumps({"folders": folders, "images": image_names, "tiles": entries}).encode('utf-8')
+        if len(index) == index_length:
+            break
+        index_length = len(index)
+
+    temp_pack = output_pack + ".tmp"
+    with open(temp_pack, 'wb') as out:
+        out.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(index)))
+        out.write(index)
+        with open(temp_data, 'rb') as data_file:
+            shutil.copyfileobj(data_file, out)
+    os.remove(temp_data)
+    os.replace(temp_pack, output_pack)
+
+    print(f"Tile pack created: {output_pack}")
+    print(f"Packed {len(tiles)} tiles from {len(folders)} folders ({os.path.getsize(output_pack) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    base_folder = sys.argv[1] if len(sys.argv) > 1 else script_dir
+    output_pack = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(script_dir), "images_test_tiles.tpack")
+
+    if not os.path.exists(os.path.join(base_folder, "google_earth_images")):
+        print("Error: Cannot find 'google_earth_images' folder")
+        print("Base folder:", base_folder)
+        exit(1)
+
+    build_tile_pack(base_folder, output_pack)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Shared store of tile derivatives for the HTML and PDF builders.
+
+A source tile is decoded once for all the derivatives asked for together,
+each smaller one resized from the previous:
+
+    preview    1200 px  PNG, full-size view
+    thumbnail  800 px   PNG, HTML table cell
+    print      384 px   JPEG, PDF table cell
+
+Google Earth images are cropped to a centred square first. Derivatives are
+cached on disk by source hash and derivative settings, so a derivative of a
+tile that did not change is made once, whichever builder asks for it first.
+
+JPEG sources are decoded directly at 1/2, 1/4 or 1/8 scale (draft mode) when
+the largest derivative allows it, before the Google Earth crop. Decodes that
+would exceed the memory limit of the worker are refused.
+"""
+
+import math
+import os
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+
+from tile_pack import open_tile_source
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_ROOT, ".tile_cache")
+
+# Memory a single decode may use, per worker process (see set_memory_limit)
+MEMORY_LIMIT_MB = 1024
+
+# Folders whose images are cropped to a centred square
+SQUARE_FOLDERS = ('google_earth_images',)
+
+# kind: (max size in pixels, format, PNG compression level or JPEG quality).
+# Print derivatives are JPEG, which ReportLab embeds in the PDF without
+# decoding it; the tiles are opaque and the page is white anyway.
+DERIVATIVES = {
+    'thumbnail': (800, 'PNG', 6),
+    'preview': (1200, 'PNG', 1),
+    'print': (384, 'JPEG', 90),  # about 4x the size of a cell on the A1 page
+}
+
+FILE_EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg'}
+CONTENT_TYPES = {'PNG': 'image/png', 'JPEG': 'image/jpeg'}
+
+# Part of every cache file name: bump it when the way derivatives are made
+# changes, so older cache files are not served any more
+DERIVATIVES_VERSION = 3
+
+
+def crop_to_square(img):
+    """
+    Crop an image to a square from its centre.
+    """
+    img_width, img_height = img.size
+    min_dim = min(img_width, img_height)
+    left = (img_width - min_dim) // 2
+    top = (img_height - min_dim) // 2
+    return img.crop((left, top, left + min_dim, top + min_dim))
+
+
+def set_memory_limit(megabytes):
+    """
+    Cap the memory a decode may use in this process. Also usable as the
+    initializer of a worker pool.
+    """
+    global MEMORY_LIMIT_MB
+    MEMORY_LIMIT_MB = megabytes
+
+
+def bytes_per_pixel(mode):
+    """
+    Memory a pixel of an image mode takes once decoded by Pillow, which
+    stores 8-bit multi-band pixels (RGB included) in 4 bytes.
+    """
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+
+def decode_reduced(img, target, square=False, memory_limit_mb=None):
+    """
+    Decode an opened (not yet loaded) image at a reduced resolution that is
+    still enough for a derivative of target pixels.
+    """
+    if memory_limit_mb is None:
+        memory_limit_mb = MEMORY_LIMIT_MB
+
+    width, height = img.size
+    # Scale at which the derivative reaches target pixels
+    side = min(width, height) if square else max(width, height)
+    scale = min(1.0, target / side)
+    wanted = (max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale)))
+
+    # JPEG decodes straight at 1/2, 1/4 or 1/8 scale, a no-op for other formats.
+    # thumbnail() drafts too, but only after the crop has loaded the image.
+    img.draft(None, wanted)
+
+    needed = img.size[0] * img.size[1] * bytes_per_pixel(img.mode)
+    if memory_limit_mb and needed > memory_limit_mb * 1024 * 1024:
+        raise MemoryError(f"decoding {img.size[0]}x{img.size[1]} pixels needs {needed / 2**20:.0f} MB, "
+                          f"over the {memory_limit_mb} MB limit")
+    img.load()
+    return img
+
+
+def derivative_kinds(folder_name):
+    """
+    Derivatives produced for the tiles of a folder.
+    """
+    return list(DERIVATIVES)
+
+
+def content_type(kind):
+    """
+    MIME type of a derivative kind.
+    """
+    return CONTENT_TYPES[DERIVATIVES[kind][1]]
+
+
+def make_derivatives(img, kinds, square=False):
+    """
+    Produce the encoded bytes of every derivative kind from one decoded image.
+    The largest derivative is made first and each smaller one is resized
+    from the previous. thumbnail() box-reduces large images before LANCZOS
+    (reducing_gap), and resizes img in place, so no copy of the full decode
+    is kept.
+    """
+    if square:
+        img = crop_to_square(img)
+
+    derivatives = {}
+    for kind in sorted(kinds, key=lambda kind: DERIVATIVES[kind][0], reverse=True):
+        max_size, image_format, level = DERIVATIVES[kind]
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        if image_format == 'JPEG':
+            # Drops the alpha channel, as ReportLab does when drawing a PNG
+            img.convert('RGB').save(buffer, format='JPEG', quality=level)
+        else:
+            img.save(buffer, format=image_format, compress_level=level)
+        derivatives[kind] = buffer.getvalue()
+    return derivatives
+
+
+class TileStore:
+    """
+    Derivatives of the tiles of a tile source, cached on disk by source hash.
+    With max_cache_bytes, cache hits refresh the file time and prune()
+    removes the least recently used files beyond that size.
+    """
+
+    def __init__(self, tiles, cache_dir=DEFAULT_CACHE_DIR, memory_limit_mb=None, max_cache_bytes=None):
+        self.tiles = open_tile_source(tiles)
+        self.cache_dir = cache_dir
+        self.memory_limit_mb = memory_limit_mb
+        self.max_cache_bytes = max_cache_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cache_key(self, source_hash, kind):
+        """
+        Name of a cached derivative, changes with the source and the settings.
+        """
+        max_size, image_format, level = DERIVATIVES[kind]
+        return f"{source_hash}_{kind}_{max_size}{image_format.lower()}{level}v{DERIVATIVES_VERSION}"
+
+    def cache_path(self, source_hash, kind):
+        extension = FILE_EXTENSIONS[DERIVATIVES[kind][1]]
+        return os.path.join(self.cache_dir, source_hash[:2], f"{self.cache_key(source_hash, kind)}{extension}")
+
+    def get(self, folder_name, image_name, kind='thumbnail'):
+        """
+        Encoded bytes of one derivative, decoding the source on a cache miss.
+        """
+        return self.get_many(folder_name, image_name, [kind])[kind]
+
+    def get_many(self, folder_name, image_name, kinds):
+        """
+        Encoded bytes of several derivatives of a tile, by kind. The ones
+        missing from the cache are made from a single decode of the source.
+        """
+        for kind in kinds:
+            if kind not in derivative_kinds(folder_name):
+                raise KeyError(f"no {kind} derivative for the tiles of {folder_name}")
+        source_hash = self.tiles.hash(folder_name, image_name)
+        derivatives = {}
+        missing = []
+        for kind in kinds:
+            cache_path = self.cache_path(source_hash, kind)
+            try:
+                with open(cache_path, 'rb') as f:
+                    derivatives[kind] = f.read()
+            except FileNotFoundError:
+                missing.append(kind)  # not built yet, or just pruned
+                continue
+            if self.max_cache_bytes is not None:
+                try:
+                    os.utime(cache_path)  # recently used, pruned last
+                except OSError:
+                    pass
+        if missing:
+            derivatives.update(self.build(folder_name, image_name, missing, source_hash))
+        return derivatives
+
+    def build(self, folder_name, image_name, kinds=None, source_hash=None):
+        """
+        Decode a source tile and cache the derivative kinds given (all of
+        them by default). Returns them.
+        """
+        if source_hash is None:
+            source_hash = self.tiles.hash(folder_name, image_name)
+        if kinds is None:
+            kinds = derivative_kinds(folder_name)
+
+        square = folder_name in SQUARE_FOLDERS
+        target = max(DERIVATIVES[kind][0] for kind in kinds)
+
+        img = self.tiles.open_image(folder_name, image_name)
+        img = decode_reduced(img, target, square, self.memory_limit_mb)
+        derivatives = make_derivatives(img, kinds, square)
+
+        for kind, data in derivatives.items():
+            cache_path = self.cache_path(source_hash, kind)
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Write then rename so a concurrent build never reads a partial
+            # file, each build with its own temporary file (threads included)
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(cache_path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, cache_path)
+        return derivatives
+
+    def prune(self):
+        """
+        Remove the least recently used cache files until the cache fits in
+        max_cache_bytes. Returns the number of files removed.
+        """
+        if self.max_cache_bytes is None:
+            return 0
+        entries = []
+        for directory, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def close(self):
+        self.tiles.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
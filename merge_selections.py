@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Fold one or more selectedimages.txt exports into selections.json.
+Usage: python merge_selections.py [export1.txt] [export2.txt] ... [--replace]
+
+Without arguments selectedimages.txt is merged. The interactive table reads
+selections.json when it loads, so there is no need to rebuild it afterwards.
+"""
+
+import os
+import sys
+
+from selections_io import SELECTIONS_FILE, load_selections, read_selected_images_txt, save_selections
+
+
+def merge_selections(export_files, selections_file=SELECTIONS_FILE, replace=False):
+    """
+    Merge the selected cells of every export into selections_file.
+    With replace=True the existing selections are dropped first.
+    """
+    cells, _, columns = load_selections(selections_file)
+    if replace:
+        cells = set()
+    previous = len(cells)
+
+    for export_file in export_files:
+        if not os.path.exists(export_file):
+            print(f"Error: {export_file} not found")
+            return False
+        exported = read_selected_images_txt(export_file, columns)
+        print(f"Found {len(exported)} selected images in {export_file}")
+        cells |= exported
+
+    save_selections(cells, selections_file)
+    print(f"Updated {selections_file}: {previous} -> {len(cells)} selected images")
+    return True
+
+
+def main():
+    args = sys.argv[1:]
+    replace = '--replace' in args
+    export_files = [arg for arg in args if arg != '--replace'] or ["selectedimages.txt"]
+
+    if merge_selections(export_files, replace=replace):
+        print("Selections merged successfully!")
+        print("Reload the interactive table to see them.")
+    else:
+        print("Failed to merge selections.")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,13 @@
 Script to process selectedimages.txt and update selections.json
 """
 
-import json
 import os
 
+from selections_io import read_selected_images_txt, save_selections
+
 def process_selected_images():
     """
-    Read selectedimages.txt and extract image IDs to update selections.json
+    Read selectedimages.txt and pack the selected cells into selections.json
     """
     selected_images_file = "selectedimages.txt"
     selections_file = "selections.json"
@@ -17,29 +18,15 @@ def process_selected_images():
         print(f"Error: {selected_images_file} not found")
         return False
     
-    # Read the file and extract image IDs (every odd line)
-    selected_image_ids = []
-    with open(selected_images_file, 'r') as f:
-        lines = f.readlines()
-    
-    for i in range(0, len(lines), 2):  # Every odd line (0, 2, 4, ...)
-        if i < len(lines):
-            image_id = lines[i].strip()
-            if image_id:
-                selected_image_ids.append(image_id)
-    
-    print(f"Found {len(selected_image_ids)} selected images")
+    # Read the exported bitset (older exports: one image ID every odd line)
+    selected_cells = read_selected_images_txt(selected_images_file)
     
-    # Create selections data
-    selections_data = {
-        "selected_images": selected_image_ids
-    }
+    print(f"Found {len(selected_cells)} selected images")
     
-    # Write to selections.json
+    # Write to selections.json (and its selections.js sidecar)
     try:
-        with open(selections_file, 'w') as f:
-            json.dump(selections_data, f, indent=2)
-        print(f"Updated {selections_file} with {len(selected_image_ids)} selected images")
+        save_selections(selected_cells, selections_file)
+        print(f"Updated {selections_file} with {len(selected_cells)} selected images")
         return True
     except Exception as e:
         print(f"Error writing selections file: {e}")
@@ -49,7 +36,7 @@ if __name__ == "__main__":
     success = process_selected_images()
     if success:
         print("\nSelections processed successfully!")
-        print("Now run: python images_test_tiles/make_interactive_table.py")
-        print("to regenerate the HTML with the pre-selected images.")
+        print("Reload interactive_image_table.html to see them, no rebuild needed.")
+        print("To add to the existing selections instead, use: python merge_selections.py")
     else:
         print("Failed to process selections.")
@@ -0,0 +1,2 @@
+// Generated from selections.json, used when the table is opened from disk
+window.preSelections = {"version": 2, "rows": ["1_A.png", "2_A.png", "2_B.png", "2_B_bis.png", "3_A.png", "3_A_bis.png", "3_B.png", "3_B_bis.png", "3_C.png", "4_A.png", "4_A_bis.png", "4_B.png", "4_B_bis.png", "4_C.png", "4_C_bis.png", "4_D.png", "5_A.png"], "columns": ["google_earth_images", "cd20cf05pdk20pmp30eps02", "cd20cf05pdk20pmp30eps03", "cd20cf05pdk5pmp30eps02", "cd20cf05pdk5pmp30eps03", "cd20cf07pdk20pmp30eps02", "cd20cf07pdk20pmp30eps03", "cd20cf07pdk20pmp30eps04", "cd20cf07pdk20pmp60eps02", "cd20cf07pdk20pmp60eps03", "cd20cf07pdk20pmp60eps04", "cd20cf07pdk5pmp100eps02", "cd20cf07pdk5pmp100eps03", "cd20cf07pdk5pmp100eps04", "cd20cf07pdk5pmp30eps02", "cd20cf07pdk5pmp30eps03", "cd20cf07pdk5pmp30eps04", "cd20cf07pdk5pmp60eps02", "cd20cf07pdk5pmp60eps03", "cd20cf07pdk5pmp60eps04"], "bits": "AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA=="};
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Shared helpers to read and write the selection files used by the interactive table.
+
+The table page loads selections.json at runtime (or the selections.js sidecar
+when it is opened from disk, where fetch() is not allowed), so writing these
+two files is all it takes to update the selections shown to everyone.
+
+Selections are stored as one packed bitset addressed by (row, column):
+
+    {
+      "version": 2,
+      "rows": ["1_A.png", "2_A.png", ...],                 # image names
+      "columns": ["google_earth_images", "cd20...", ...],  # folders
+      "bits": "<base64>"
+    }
+
+Cell (row, column) is bit row * len(columns) + column, least significant bit
+first within each byte. The axes are stored next to the bits so a file written
+for an older sweep can still be remapped by name when folders are added.
+The page keeps the same record in a single localStorage key and exports it as
+selectedimages.txt.
+"""
+
+import base64
+import json
+import os
+
+from images_test_tiles.tile_pack import IMAGE_EXTENSIONS, scan_folders
+
+SELECTIONS_FILE = "selections.json"
+SELECTIONS_VERSION = 2
+IMAGES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images_test_tiles")
+
+
+def sidecar_path(selections_file):
+    """
+    selections.json -> selections.js
+    """
+    return os.path.splitext(selections_file)[0] + ".js"
+
+
+def scan_axes(base_folder=IMAGES_FOLDER):
+    """
+    Return (rows, columns) in the order used by make_interactive_table.py
+    (see tile_pack.scan_folders): image names sorted, folders sorted with
+    google_earth_images first.
+    """
+    if not os.path.isdir(base_folder):
+        return [], []
+    columns, rows = scan_folders(base_folder)
+    return rows, columns
+
+
+def pack_bits(indices, size):
+    """
+    Pack bit indices into a base64 string of ceil(size / 8) bytes.
+    """
+    bits = bytearray((size + 7) // 8)
+    for i in indices:
+        bits[i >> 3] |= 1 << (i & 7)
+    return base64.b64encode(bytes(bits)).decode()
+
+
+def unpack_bits(text):
+    """
+    Return the indices of the bits set in a base64 packed bitset.
+    """
+    bits = base64.b64decode(text or '')
+    return [byte_index * 8 + bit
+            for byte_index, byte in enumerate(bits) if byte
+            for bit in range(8) if byte >> bit & 1]
+
+
+def parse_legacy_id(image_id, columns=()):
+    """
+    img_cd20cf05pdk5pmp30eps03_2_B_png -> ('cd20cf05pdk5pmp30eps03', '2_B.png')
+    Returns None when the ID cannot be parsed.
+    """
+    if not image_id.startswith('img_'):
+        return None
+    rest = image_id[len('img_'):]
+
+    folder = next((c for c in columns if rest.startswith(c + '_')), None)
+    if folder is None:
+        if rest.startswith('google_earth_images_'):
+            folder = 'google_earth_images'
+        elif '_' in rest:
+            folder = rest.split('_', 1)[0]
+        else:
+            return None
+
+    name = rest[len(folder) + 1:]
+    for extension in IMAGE_EXTENSIONS:
+        suffix = '_' + extension[1:]
+        if name.endswith(suffix):
+            return folder, name[:-len(suffix)] + extension
+    return None
+
+
+def parse_cell(text, columns=()):
+    """
+    Accept either 'folder/image.png' or a legacy 'img_folder_image_png' ID.
+    """
+    text = text.strip()
+    if '/' in text:
+        folder, name = text.split('/', 1)
+        return folder, name
+    return parse_legacy_id(text, columns)
+
+
+def decode_selections(data):
+    """
+    Return the set of selected (folder, image) cells of a selections record.
+    Records from before the bitset format ({"selected_images": [...]}) are accepted.
+    """
+    if 'bits' in data:
+        rows = data.get('rows', [])
+        columns = data.get('columns', [])
+        cells = set()
+        for i in unpack_bits(data['bits']):
+            row, column = divmod(i, len(columns))
+            if row >= len(rows):
+                break
+            cells.add((columns[column], rows[row]))
+        return cells
+
+    cells = set()
+    for image_id in data.get('selected_images', []):
+        cell = parse_legacy_id(image_id)
+        if cell:
+            cells.add(cell)
+    return cells
+
+
+def encode_selections(cells, rows, columns):
+    """
+    Build a selections record for the given axes. Cells whose folder or image
+    is not on the axes yet are appended to them so nothing is lost.
+    """
+    rows = list(rows)
+    columns = list(columns)
+    row_index = {name: i for i, name in enumerate(rows)}
+    column_index = {name: i for i, name in enumerate(columns)}
+    for folder, name in sorted(cells):
+        if folder not in column_index:
+            column_index[folder] = len(columns)
+            columns.append(folder)
+        if name not in row_index:
+            row_index[name] = len(rows)
+            rows.append(name)
+
+    indices = [row_index[name] * len(columns) + column_index[folder] for folder, name in cells]
+    return {
+        "version": SELECTIONS_VERSION,
+        "rows": rows,
+        "columns": columns,
+        "bits": pack_bits(indices, len(rows) * len(columns)),
+    }
+
+
+def load_selections(selections_file=SELECTIONS_FILE):
+    """
+    Return (cells, rows, columns) stored in selections_file.
+    """
+    try:
+        if os.path.exists(selections_file):
+            with open(selections_file, 'r') as f:
+                data = json.load(f)
+            return decode_selections(data), data.get('rows', []), data.get('columns', [])
+    except Exception as e:
+        print(f"Warning: Could not load selections from {selections_file}: {e}")
+    return set(), [], []
+
+
+def read_selected_images_txt(selected_images_file, columns=()):
+    """
+    Read an export of the page (selectedimages.txt) and return its cells.
+    The export is the JSON selections record; older exports listed one image ID
+    on every odd line followed by its readable name.
+    """
+    with open(selected_images_file, 'r') as f:
+        content = f.read()
+
+    if content.lstrip().startswith('{'):
+        return decode_selections(json.loads(content))
+
+    cells = set()
+    lines = content.splitlines()
+    for i in range(0, len(lines), 2):
+        if lines[i].strip():
+            cell = parse_cell(lines[i], columns)
+            if cell:
+                cells.add(cell)
+    return cells
+
+
+def save_selections(cells, selections_file=SELECTIONS_FILE, base_folder=IMAGES_FOLDER):
+    """
+    Write selections.json and its selections.js sidecar, addressed with the
+    axes of the current images_test_tiles tree. Returns the written record.
+    """
+    rows, columns = scan_axes(base_folder)
+    record = encode_selections(cells, rows, columns)
+
+    with open(selections_file, 'w') as f:
+        json.dump(record, f, indent=2)
+
+    with open(sidecar_path(selections_file), 'w') as f:
+        f.write("// Generated from selections.json, used when the table is opened from disk\n")
+        f.write(f"window.preSelections = {json.dumps(record)};\n")
+
+    return record
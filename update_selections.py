@@ -1,38 +1,33 @@
 #!/usr/bin/env python3
 """
-Script to update the selections.json file with selected image IDs.
-Usage: python update_selections.py [image_id1] [image_id2] ...
+Script to update the selections.json file with selected images.
+Usage: python update_selections.py [folder/image1] [folder/image2] ...
+Legacy image IDs (img_folder_image_png) are accepted too.
 """
 
-import json
 import sys
-import os
 
-def update_selections(selected_image_ids):
+from selections_io import load_selections, parse_cell, save_selections
+
+def update_selections(selected_images):
     """
-    Update the selections.json file with the provided image IDs.
+    Update the selections.json file with the provided images.
     """
     selections_file = "selections.json"
+    _, _, columns = load_selections(selections_file)
     
-    # Load existing selections
-    try:
-        if os.path.exists(selections_file):
-            with open(selections_file, 'r') as f:
-                data = json.load(f)
-        else:
-            data = {"selected_images": []}
-    except Exception as e:
-        print(f"Error loading existing selections: {e}")
-        data = {"selected_images": []}
-    
-    # Update with new selections
-    data["selected_images"] = selected_image_ids
+    selected_cells = set()
+    for image in selected_images:
+        cell = parse_cell(image, columns)
+        if cell is None:
+            print(f"Warning: Could not parse {image}, skipping")
+            continue
+        selected_cells.add(cell)
     
-    # Write back to file
+    # Write selections.json and its selections.js sidecar
     try:
-        with open(selections_file, 'w') as f:
-            json.dump(data, f, indent=2)
-        print(f"Updated {selections_file} with {len(selected_image_ids)} selected images")
+        save_selections(selected_cells, selections_file)
+        print(f"Updated {selections_file} with {len(selected_cells)} selected images")
         return True
     except Exception as e:
         print(f"Error writing selections file: {e}")
@@ -40,17 +35,16 @@ def update_selections(selected_image_ids):
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python update_selections.py [image_id1] [image_id2] ...")
-        print("Example: python update_selections.py img_folder1_image1.png img_folder2_image2.png")
+        print("Usage: python update_selections.py [folder/image1] [folder/image2] ...")
+        print("Example: python update_selections.py google_earth_images/1_A.png cd20cf05pdk5pmp30eps03/2_B.png")
         return
     
-    selected_image_ids = sys.argv[1:]
-    success = update_selections(selected_image_ids)
+    selected_images = sys.argv[1:]
+    success = update_selections(selected_images)
     
     if success:
         print("Selections updated successfully!")
-        print("Now run: python images_test_tiles/make_interactive_table.py")
-        print("to regenerate the HTML with the new selections.")
+        print("Reload interactive_image_table.html to see them, no rebuild needed.")
     else:
         print("Failed to update selections.")
 